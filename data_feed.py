@@ -1,46 +1,315 @@
 from pytezos import *
-from time import sleep, time
-from requests import get
-
-# admin setup to be able to execute transactions
-admin = pytezos.using(shell='https://hangzhounet.smartpy.io',
-                      key="")
-id: int = 84085
-
-contract = admin.contract("KT1HJmhtdDw88kCEEiyaw6iYwzPsTphxzzRz")  # set the contract
-counter = int(contract.storage['counter']())
-
-while True:
-    try:  # try catch if the rpc node is down
-        print(int(contract.storage['counter']()), counter)
-        if int(contract.storage['counter']()) > counter:
-            try:
-
-                request = get(url=f"https://api.hangzhounet.tzkt.io/v1/bigmaps/{id}/keys/{counter}").json()["value"]
-                print(request)
-                if request['status']:
-                    break
-                pair: str = "BTCETH"
-                res: dict = get(
-                    url=f"https://api.binance.com/api/v3/ticker/24hr?symbol={pair}").json()  # get the api data from binance
-                data: dict = {
-                    "pair": pair,
-                    "open_time": int(int(res["openTime"])/1000),
-                    "close_time": int(int(res["closeTime"])/1000),
-                    "last_price": int(float(res["lastPrice"]) * 10 ** 8),
-                    "low_price": int(float(res["lowPrice"]) * 10 ** 8),
-                    "high_price": int(float(res["highPrice"]) * 10 ** 8),
-                    "volume": int(float(res["volume"]) * 10 ** 8),
-                    "quote_volume": int(float(res["quoteVolume"]) * 10 ** 8),
-                    "request_id": int(counter),
-                    "target": f"{request['target_address']}%{request['target_entrypoint']}"
-                }
-                print(data)
-                tx = contract.update(data).send(min_confirmations=1)
-                counter = int(contract.storage['counter']())
-            except Exception as e:
-                print(str(e))
+from pytezos.rpc import ShellQuery
+from argparse import ArgumentParser
+from functools import partial
+from time import time
+from multiprocessing import Process
+from feeder.heads import watch_heads
+from feeder.injector import Injector
+from feeder.metrics import METRICS_PORT, metrics, tracer
+from feeder.cache import PriceCache
+from feeder.checkpoint import CHECKPOINT, Checkpoint
+from feeder.preflight import preflight
+from feeder.scanner import PendingRequests
+from feeder.scheduler import BUDGET, REFRESH_FEE, RefreshScheduler
+from feeder.sessions import PooledNode, pool
+from feeder.shards import Leases
+from feeder.snapshot import StorageSnapshot
+from feeder.sources import Binance, HedgedQuotes, KuCoin
+from feeder.stream import TickerStream
+
+shell: str = 'https://hangzhounet.smartpy.io'
+oracle_address: str = "KT1HJmhtdDw88kCEEiyaw6iYwzPsTphxzzRz"
+id: int = 84085  # requests big_map
+sources: list = [Binance(), Binance('https://api1.binance.com'), KuCoin()]  # in order of preference
+
+BATCH_SIZE: int = 20  # max update calls per operation group, keeps the group under the gas and size limits
+SCRIPT_ERRORS: tuple = ("script_rejected", "runtime_error")  # rpc errors of a failing call, not of the node
+
+
+def chunks(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def build_update(request_id: int, request: dict, quote: dict) -> dict:
+    return {
+        **quote,
+        "request_id": int(request_id),
+        "target": f"{request['target_address']}%{request['target_entrypoint']}"
+    }
+
+
+def quotes_for(pairs: list, cache: PriceCache, stream: TickerStream = None) -> dict:
+    # streamed quotes first, the stale or missing pairs come from the rest tickers
+    quotes: dict = stream.get_many(pairs) if stream is not None else {}
+    missing: list = [pair for pair in pairs if pair not in quotes]
+    if missing:
+        quotes.update(cache.get_many(missing))
+    return quotes
+
+
+def prepare(contract, scanner: PendingRequests, quotes: dict, check=None, by_pair: bool = False) -> tuple:
+    # update calls for the indexed requests, every request for a pair reuses the same quote
+    # and check drops the calls that would fail on chain;
+    # returns the (request_id, request, call) to inject and the ids left without a call
+    calls: list = []
+    skipped: list = []
+    for request_id, request in scanner.pending(by_pair):
+        if request["pair"] not in quotes:
+            print(f"request {request_id}: no quote for {request['pair']}")
+            skipped.append(request_id)
+            continue
+        tracer.mark([request_id], "fetch")
+        data: dict = build_update(request_id, request, quotes[request["pair"]])
+        print(data)
+        calls.append((request_id, request, contract.update(data)))
+    if check is not None:
+        checked: list = check(calls)
+        kept: set = {request_id for request_id, _, _ in checked}
+        skipped += [request_id for request_id, _, _ in calls if request_id not in kept]
+        calls = checked
+    tracer.mark([request_id for request_id, _, _ in calls], "build")
+    return calls, skipped
+
+
+def inject(injector: Injector, scanner: PendingRequests, batch: list, level: int, failed: list) -> bool:
+    # a group is atomic and the preflight can't see the target callbacks: a group rejected for a failing
+    # script is split in halves until the failing calls are alone, their request ids go to failed;
+    # returns False when the node takes no group at all
+    requests: dict = {request_id: request for request_id, request, _ in batch}
+    try:  # no wait for the inclusion, the injector follows the group on the next heads
+        print(injector.inject([call for _, _, call in batch], requests, level))
     except Exception as e:
         print(str(e))
-        sleep(20)
-    sleep(100)
+        if not any(error in str(e) for error in SCRIPT_ERRORS):
+            return False
+        if len(batch) == 1:
+            failed.append(batch[0][0])
+            return True
+        half: int = len(batch) // 2
+        return inject(injector, scanner, batch[:half], level, failed) \
+            and inject(injector, scanner, batch[half:], level, failed)
+    for request_id in requests:
+        scanner.remove(request_id)
+    return True
+
+
+def serve(injector: Injector, contract, scanner: PendingRequests, quotes: dict, level: int, check=None,
+          by_pair: bool = False, batch_size: int = BATCH_SIZE) -> list:
+    # answer every indexed request with bulk operation groups, injected ids leave the index and the
+    # requests whose update fails on its own are retired; returns the ids left without an injected call
+    calls, skipped = prepare(contract, scanner, quotes, check, by_pair)
+    failed: list = []
+    for batch in chunks(calls, batch_size):
+        if not inject(injector, scanner, batch, level, failed):
+            break
+    for request_id in failed:
+        print(f"request {request_id} retired: its update fails on chain")
+        scanner.remove(request_id)
+    return skipped + failed
+
+
+def refresh(scheduler: RefreshScheduler, injector: Injector, contract, snapshot: StorageSnapshot,
+            scanner: PendingRequests, level: int):
+    # own requests for the hot pairs, served on the next block; a failure here never holds back
+    # the requests of others, and only the injected refreshes are charged to the budget
+    try:
+        scheduler.observe(level)
+        price: int = snapshot.storage["request_price"]
+        cost: int = price + REFRESH_FEE
+        pairs: list = scheduler.plan(level, snapshot.supported_pairs, set(scanner.by_pair), cost)
+        if pairs:
+            print(injector.inject(scheduler.requests(contract, pairs, price), {}, level, entrypoint="get_price"))
+            scheduler.spend(level, pairs, cost)
+        print(f"inline answers: {scheduler.ratio():.0%}")
+        metrics.set("feeder_inline_ratio", scheduler.ratio())
+    except Exception as e:
+        print(f"refresh: {e}")
+
+
+def feed(key: str, leases: Leases = None, checkpoint_path: str = CHECKPOINT, streaming: bool = False, quorum: int = 1,
+         refresh_target: str = None, refresh_budget: int = BUDGET, metrics_port: int = METRICS_PORT):
+    # admin setup to be able to execute transactions, every worker signs with its own whitelisted key
+    admin = pytezos.using(shell=ShellQuery(node=PooledNode(shell, pool)), key=key)
+    contract = admin.contract(oracle_address)  # set the contract
+    scanner = PendingRequests(id, owns=leases.owns if leases is not None else None)  # this worker's shards only
+    cache = PriceCache(HedgedQuotes(sources, quorum).fetch)  # one round of ticker calls per freshness window
+    stream: TickerStream = None
+    if streaming:
+        stream = TickerStream()
+        stream.start([])
+    snapshot = StorageSnapshot(contract)
+    checkpoint = Checkpoint(checkpoint_path)
+    injector = Injector(admin, checkpoint=checkpoint)
+    checkpoint.restore(scanner, injector, cache)  # resume after the last served request
+    sender: str = admin.key.public_key_hash()
+    scheduler: RefreshScheduler = None
+    if refresh_target is not None:
+        scheduler = RefreshScheduler(id, refresh_target, budget=refresh_budget)
+    if metrics_port:  # prometheus scrape endpoint on localhost
+        metrics.serve(metrics_port)
+
+    for head in watch_heads(shell):  # wake up on every new block instead of sleeping
+        try:  # try catch if the rpc node or the indexer is down
+            if leases is not None:  # renewed before the scan, which only indexes the owned shards
+                owned: set = leases.owned
+                busy: set = {request_id % leases.shards for request_id in injector.request_ids()}
+                if leases.renew(busy) - owned:  # shards taken over, the earlier scans skipped their requests
+                    scanner.last_seen = -1
+            # the storage read, the indexer scan and the price fetch run in parallel, a tick waits for the
+            # slowest of them instead of their sum; the scan doesn't wait for the counter of the new storage
+            # and the quotes are for the pairs supported at the previous head
+            pairs: list = sorted(snapshot.supported_pairs)
+            for result in pool.gather([partial(snapshot.load, head["hash"], head["level"]), scanner.scan,
+                                       partial(quotes_for, pairs, cache, stream)]):
+                if isinstance(result, Exception):
+                    raise result
+            quotes: dict = result
+            if stream is not None:
+                stream.subscribe(snapshot.supported_pairs)
+            confirmed, retry = injector.track(head)
+            for request_id, request in retry.items():  # dropped or failed on chain: serve them again
+                scanner.add(request_id, request)
+            if leases is not None:  # shards lost to a worker back from a restart
+                scanner.retain(leases.owns)
+            for request_id in injector.request_ids():  # still pending on chain but already injected
+                scanner.remove(request_id)
+            if scheduler is not None:
+                refresh(scheduler, injector, contract, snapshot, scanner, head["level"])
+            print(head["level"], snapshot.counter, len(scanner), len(injector), len(confirmed))
+            metrics.set("feeder_backlog", len(scanner))
+            metrics.set("feeder_inflight_groups", len(injector))
+            metrics.set("feeder_head_level", head["level"])
+            # blacklisted pairs get no quote, their requests are retired unless they are newer than the
+            # snapshot: a pair whitelisted in a later block would look unsupported
+            for pair in set(scanner.by_pair) - snapshot.supported_pairs:
+                for request_id in sorted(scanner.by_pair[pair]):
+                    if scanner.settled(request_id, snapshot.level):
+                        print(f"request {request_id} retired: {pair} isn't supported")
+                        scanner.remove(request_id)
+            if len(scanner):
+                added: list = sorted(snapshot.supported_pairs.difference(pairs))
+                if added:  # pairs whitelisted at this head, or the first head
+                    quotes.update(quotes_for(added, cache, stream))
+                retired: list = []
+                serve(injector, contract, scanner, quotes, head["level"],
+                      check=partial(preflight, snapshot, sender, now=int(time()), retired=retired))
+                for request_id in retired:  # would fail on every head, kept they'd hold the checkpoint back
+                    if scanner.settled(request_id, snapshot.level):
+                        print(f"request {request_id} retired")
+                        scanner.remove(request_id)
+            checkpoint.save(scanner, cache)
+        except Exception as e:
+            print(str(e))
+            metrics.inc("feeder_loop_errors_total")
+
+
+def report(contract, scanner: PendingRequests, quotes: dict, check=None, batch_size: int = BATCH_SIZE) -> list:
+    # the operation groups a backfill would inject, nothing is signed or sent, returns their request ids
+    for pair, request_ids in sorted(scanner.by_pair.items()):
+        quote: dict = quotes.get(pair)
+        print(f"{pair}: {len(request_ids)} requests, "
+              + (f"last price {quote['last_price']}" if quote is not None else "no quote"))
+    calls, skipped = prepare(contract, scanner, quotes, check=check, by_pair=True)
+    groups: list = []
+    for i, batch in enumerate(chunks(calls, batch_size)):
+        groups.append([request_id for request_id, _, _ in batch])
+        pairs: list = sorted({request["pair"] for _, request, _ in batch})
+        print(f"group {i}: {len(batch)} updates for {', '.join(pairs)}: {groups[-1]}")
+    print(f"dry run: {len(calls)} updates in {len(groups)} groups, {len(skipped)} requests skipped {skipped}")
+    return groups
+
+
+def backfill(key: str, first: int, last: int, dry_run: bool = False, batch_size: int = BATCH_SIZE, quorum: int = 1):
+    # serves the requests from first to last still unserved after an outage, every batch is injected on the
+    # first head without waiting for the previous ones, then the heads are followed until every group is final
+    admin = pytezos.using(shell=ShellQuery(node=PooledNode(shell, pool)), key=key)
+    contract = admin.contract(oracle_address)
+    scanner = PendingRequests(id)
+    served: int = scanner.scan_range(first, last)
+    print(f"requests {first} to {last}: {served} served, {len(scanner)} unserved in {len(scanner.by_pair)} pairs")
+    cache = PriceCache(HedgedQuotes(sources, quorum).fetch)
+    snapshot = StorageSnapshot(contract)
+    injector = Injector(admin)
+    sender: str = admin.key.public_key_hash()
+    delivered: int = 0
+    skipped: list = []
+
+    for head in watch_heads(shell):
+        try:
+            snapshot.load(head["hash"], head["level"])
+            confirmed, retry = injector.track(head)
+            delivered += len(confirmed)
+            for request_id, request in retry.items():  # dropped or failed on chain: serve them again
+                scanner.add(request_id, request)
+            if len(scanner):
+                quotes: dict = quotes_for(sorted(scanner.by_pair), cache)
+                check = partial(preflight, snapshot, sender, now=int(time()))
+                if dry_run:
+                    report(contract, scanner, quotes, check, batch_size)
+                    return
+                for request_id in serve(injector, contract, scanner, quotes, head["level"], check=check,
+                                        by_pair=True, batch_size=batch_size):
+                    scanner.remove(request_id)  # no quote or rejected by the preflight, not worth another block
+                    skipped.append(request_id)
+            print(head["level"], len(scanner), len(injector), len(confirmed))
+            if not len(scanner) and not len(injector):
+                print(f"backfill done: {delivered} delivered, {len(skipped)} skipped {skipped}")
+                return
+        except Exception as e:
+            print(str(e))
+
+
+def main():
+    parser = ArgumentParser(description="Oracle data feeder")
+    parser.add_argument("--key", action="append", default=[],
+                        help="whitelisted key, repeat it to run one worker process per key")
+    parser.add_argument("--shards", type=int, help="total number of workers across hosts, default: number of keys")
+    parser.add_argument("--first-shard", type=int, default=0, help="home shard of the first key of this host")
+    parser.add_argument("--leases", default="feeder.leases", help="lease file shared by the workers of this host")
+    parser.add_argument("--checkpoint", default=CHECKPOINT,
+                        help="sqlite checkpoint, workers add their home shard to the file name")
+    parser.add_argument("--quorum", type=int, default=1,
+                        help="quote sources to wait for, their quotes are aggregated by median")
+    parser.add_argument("--refresh-target", help="address%%entrypoint of our own client, enables the refreshes "
+                                                 "of the most requested pairs ahead of demand")
+    parser.add_argument("--refresh-budget", type=int, default=BUDGET, help="mutez the refreshes may spend per hour")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="prometheus endpoint on localhost, workers add their index to it, 0 disables it")
+    parser.add_argument("--stream", action="store_true",
+                        help="keep the tickers of the supported pairs from the exchange websocket")
+    commands = parser.add_subparsers(dest="command")
+    backfilling = commands.add_parser("backfill", help="serve a range of requests left unserved, then exit; "
+                                                       "use a key no running worker signs with")
+    backfilling.add_argument("--from", dest="first", type=int, required=True, help="first request id")
+    backfilling.add_argument("--to", dest="last", type=int, required=True, help="last request id, included")
+    backfilling.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="max update calls per group")
+    backfilling.add_argument("--dry-run", action="store_true", help="print the groups instead of injecting them")
+    args = parser.parse_args()
+    keys: list = args.key or [""]
+    if args.command == "backfill":
+        backfill(keys[0], args.first, args.last, dry_run=args.dry_run, batch_size=args.batch_size,
+                 quorum=args.quorum)
+        return
+    shards: int = args.shards or len(keys)
+
+    if shards == 1:
+        feed(keys[0], checkpoint_path=args.checkpoint, streaming=args.stream, quorum=args.quorum,
+             refresh_target=args.refresh_target, refresh_budget=args.refresh_budget, metrics_port=args.metrics_port)
+        return
+    workers: list = [
+        Process(target=feed, args=(key, Leases(args.leases, args.first_shard + i, shards,
+                                                  range(args.first_shard, args.first_shard + len(keys))),
+                                   f"{args.checkpoint}.{args.first_shard + i}", args.stream, args.quorum,
+                                   args.refresh_target if i == 0 else None, args.refresh_budget,
+                                   args.metrics_port and args.metrics_port + i))
+        for i, key in enumerate(keys)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
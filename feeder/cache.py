@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+from time import monotonic
+
+TTL: float = 30  # seconds a quote stays fresh, about one block
+SIZE: int = 1024  # pairs kept before evicting the least recently used one
+
+
+class PriceCache:
+    # quotes by pair with a freshness window, concurrent misses on the same pairs share one fetch
+
+    def __init__(self, fetch, ttl: float = TTL, size: int = SIZE, clock=monotonic):
+        self.fetch = fetch  # list of pairs -> {pair: quote}, called once per batch of misses
+        self.ttl: float = ttl
+        self.size: int = size
+        self.clock = clock
+        self.quotes: OrderedDict = OrderedDict()  # pair -> (fetched at, quote)
+        self.inflight: dict = {}  # pair -> future of the fetch currently running for it
+        self.lock = Lock()
+
+    def get_many(self, pairs: list) -> dict:
+        # fresh quotes for every pair the source knows, fetching only the stale or missing ones
+        quotes: dict = {}
+        waiting: dict = {}
+        missing: list = []
+        with self.lock:
+            now: float = self.clock()
+            for pair in pairs:
+                entry = self.quotes.get(pair)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self.quotes.move_to_end(pair)
+                    quotes[pair] = entry[1]
+                elif pair in self.inflight:
+                    waiting[pair] = self.inflight[pair]
+                else:
+                    missing.append(pair)
+            if missing:
+                future = Future()
+                for pair in missing:
+                    self.inflight[pair] = future
+
+        if missing:
+            try:
+                fetched: dict = self.fetch(missing)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self.lock:
+                    for pair in missing:
+                        del self.inflight[pair]
+            with self.lock:
+                now = self.clock()
+                for pair, quote in fetched.items():
+                    self.put(pair, quote, now)
+            future.set_result(fetched)
+            quotes.update({pair: fetched[pair] for pair in missing if pair in fetched})
+
+        for pair, pending in waiting.items():
+            fetched = pending.result()
+            if pair in fetched:
+                quotes[pair] = fetched[pair]
+        return quotes
+
+    def put(self, pair: str, quote: dict, now: float):
+        self.quotes[pair] = (now, quote)
+        self.quotes.move_to_end(pair)
+        while len(self.quotes) > self.size:
+            self.quotes.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.quotes)
@@ -0,0 +1,57 @@
+import sqlite3
+from json import dumps, loads
+from time import time
+from feeder.injector import InFlight
+from feeder.prices import Quote
+
+CHECKPOINT: str = "feeder.sqlite"
+
+
+class Checkpoint:
+    # feeder state kept on disk so a restart neither rescans the whole requests big_map
+    # nor serves again the requests whose update is still in flight
+
+    def __init__(self, path: str = CHECKPOINT):
+        self.db = sqlite3.connect(path, isolation_level=None)  # autocommit, save() opens its own transaction
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS inflight (
+                hash TEXT PRIMARY KEY, requests TEXT NOT NULL, counter INTEGER NOT NULL, level INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS quotes (pair TEXT PRIMARY KEY, quote TEXT NOT NULL, fetched_at REAL NOT NULL);
+        """)
+
+    def record(self, op_hash: str, group: InFlight):
+        self.db.execute("INSERT OR REPLACE INTO inflight VALUES (?, ?, ?, ?)",
+                        (op_hash, dumps(list(group.requests.items())), group.counter, group.level))
+
+    def forget(self, op_hash: str):
+        self.db.execute("DELETE FROM inflight WHERE hash = ?", (op_hash,))
+
+    def save(self, scanner, cache=None):
+        # every request up to the served id is on chain or in flight, the next scan starts after it
+        waiting: list = list(scanner.requests)
+        served: int = min(waiting) - 1 if waiting else scanner.last_seen
+        now: float = time()
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.execute("INSERT OR REPLACE INTO state VALUES ('served', ?)", (served,))
+            if cache is not None:
+                with cache.lock:
+                    fresh: list = [(pair, dumps(dict(quote)), now - (cache.clock() - fetched_at))
+                                   for pair, (fetched_at, quote) in cache.quotes.items()]
+                self.db.execute("DELETE FROM quotes")
+                self.db.executemany("INSERT INTO quotes VALUES (?, ?, ?)", fresh)
+
+    def restore(self, scanner, injector, cache=None):
+        row = self.db.execute("SELECT value FROM state WHERE name = 'served'").fetchone()
+        if row is not None:
+            scanner.last_seen = row[0]
+        for op_hash, requests, counter, level in self.db.execute("SELECT * FROM inflight"):
+            injector.inflight[op_hash] = InFlight({int(k): v for k, v in loads(requests)}, counter, level)
+        if cache is not None:
+            now: float = time()
+            with cache.lock:
+                for pair, quote, fetched_at in self.db.execute("SELECT * FROM quotes ORDER BY fetched_at"):
+                    cache.put(pair, Quote(**loads(quote)), cache.clock() - (now - fetched_at))
@@ -0,0 +1,62 @@
+from json import loads
+from time import sleep
+from feeder.sessions import pool
+
+POLL_INTERVAL: int = 10  # seconds between two head polls when the node doesn't stream heads
+BACKOFF: int = 1  # first retry delay in seconds while the rpc is down, doubled at each failure
+MAX_BACKOFF: int = 120
+TIMEOUT: int = 180  # longest silence accepted on the head stream before reconnecting
+STREAM_RETRY: int = 30  # polls before trying the monitoring stream again
+
+
+def backoff(failures: int) -> int:
+    return min(MAX_BACKOFF, BACKOFF * 2 ** (failures - 1))
+
+
+def stream_heads(shell: str, http_get=pool.get):
+    # the node pushes one json object per new head on /monitor/heads/main
+    with http_get(url=f"{shell}/monitor/heads/main", stream=True, timeout=TIMEOUT) as res:
+        res.raise_for_status()
+        for line in res.iter_lines():
+            if line:
+                yield loads(line)
+
+
+def poll_head(shell: str, http_get=pool.get) -> dict:
+    res = http_get(url=f"{shell}/chains/main/blocks/head/header", timeout=TIMEOUT)
+    res.raise_for_status()
+    return res.json()
+
+
+def watch_heads(shell: str, poll_interval: int = POLL_INTERVAL, http_get=pool.get, wait=sleep):
+    # yields every new block head, from the monitoring stream when the node allows it
+    # and from polling otherwise, backing off exponentially while the rpc is down
+    last: str = None
+    streaming: bool = True
+    failures: int = 0
+    polls: int = 0
+    while True:
+        try:
+            if streaming:
+                streamed: bool = False
+                for head in stream_heads(shell, http_get):
+                    streamed, failures = True, 0
+                    if head["hash"] != last:
+                        last = head["hash"]
+                        yield head
+                streaming = streamed  # the node closed the stream without a head: poll instead
+            else:
+                head: dict = poll_head(shell, http_get)
+                failures = 0
+                polls += 1
+                streaming = polls % STREAM_RETRY == 0
+                if head["hash"] != last:
+                    last = head["hash"]
+                    yield head
+                wait(poll_interval)
+        except Exception as e:
+            print(str(e))
+            failures += 1
+            if failures > 1:
+                streaming = False  # retry the stream only once, then fall back to polling
+            wait(backoff(failures))
@@ -0,0 +1,146 @@
+from pytezos.operation.fees import calculate_fee
+from pytezos.operation.result import OperationResult
+from pytezos.rpc.node import RpcError
+from feeder.metrics import metrics, tracer
+
+OPERATION_TTL: int = 5  # blocks an injected group may wait in the mempool before it's considered dropped
+CONFIRMATIONS: int = 2  # blocks on top of the inclusion block before a group is final
+
+
+class InFlight:
+    __slots__ = ("requests", "counter", "level", "block", "included")
+
+    def __init__(self, requests: dict, counter: int, level: int):
+        self.requests: dict = requests  # request id -> request, handed back to the scanner on failure
+        self.counter: int = counter  # last source counter used by the group
+        self.level: int = level  # head level at injection time
+        self.block: str = None  # hash of the block including the group
+        self.included: int = None  # level of that block
+
+
+class Injector:
+    # injects operation groups without waiting for their inclusion, the source counter is tracked locally
+    # so several groups can be in the mempool at once, track() follows them on every new head
+
+    def __init__(self, admin, ttl: int = OPERATION_TTL, confirmations: int = CONFIRMATIONS, checkpoint=None):
+        self.admin = admin
+        self.checkpoint = checkpoint  # records every group before it reaches the node
+        self.ttl: int = ttl
+        self.confirmations: int = confirmations
+        self.counter: int = None  # last counter used by an injected group
+        self.inflight: dict = {}  # operation hash -> InFlight
+        self.limits: dict = {}  # entrypoint -> (gas, storage) limits per call, learned from the node's simulation
+
+    def inject(self, calls: list, requests: dict, level: int, entrypoint: str = "update") -> str:
+        if self.counter is None:
+            self.counter = int(self.admin.account()['counter'])
+        op_hash: str = None
+        posted: bool = False
+        try:
+            group = self.build(calls, entrypoint).sign()
+            op_hash = group.hash()
+            inflight = InFlight(requests, self.counter + len(calls), level)
+            if self.checkpoint is not None:  # written ahead, a crash right after the injection can't lose it
+                self.checkpoint.record(op_hash, inflight)
+            posted = True
+            group.inject(min_confirmations=0)
+        except Exception as e:
+            if posted and not isinstance(e, RpcError):
+                # no answer from the node (read timeout, connection reset), it may hold the group: it stays in
+                # flight with its counters until track() finds it in a block or drops it after the ttl
+                print(f"{op_hash} may have reached the node: {e}")
+                metrics.inc("feeder_operations_total", status="unknown")
+            else:
+                if op_hash is not None and self.checkpoint is not None:
+                    self.checkpoint.forget(op_hash)
+                self.counter = None  # the node may disagree with the local counter, read it again next time
+                self.limits.clear()  # and the next groups are simulated, a failing call shows up before injection
+                metrics.inc("feeder_operations_total", status="rejected")
+                raise
+        self.counter += len(calls)
+        self.inflight[op_hash] = inflight
+        metrics.inc("feeder_operations_total", status="injected")
+        tracer.mark(requests, "inject")
+        return op_hash
+
+    def build(self, calls: list, entrypoint: str):
+        # every call of a group goes to the same entrypoint, get_price and update don't cost the same
+        if entrypoint not in self.limits:
+            group = self.admin.bulk(*calls).autofill(ttl=self.ttl)  # simulated against the head state
+            self.limits[entrypoint] = (max(int(content["gas_limit"]) for content in group.contents),
+                                       max(int(content["storage_limit"]) for content in group.contents))
+        else:  # calls already checked by the preflight, no run_operation round trip
+            gas_limit, storage_limit = self.limits[entrypoint]
+            group = self.admin.bulk(*calls).fill(ttl=self.ttl, counter=self.counter + 1,
+                                                 gas_limit=gas_limit * len(calls),
+                                                 storage_limit=storage_limit * len(calls))
+        for i, content in enumerate(group.contents):  # chained after the groups still in flight
+            content["counter"] = str(self.counter + 1 + i)
+            content["fee"] = str(calculate_fee(content, int(content["gas_limit"]), 1 + 96 // len(calls)))
+        return group
+
+    def track(self, head: dict) -> tuple:
+        # returns the requests confirmed on chain and the ones to inject again
+        if not self.inflight:
+            return {}, {}
+        confirmed: dict = {}
+        retry: dict = {}
+        self.inspect(head["hash"], head["level"], retry)
+
+        for op_hash, group in list(self.inflight.items()):
+            if op_hash not in self.inflight:  # failed in a block inspected for another group
+                continue
+            if group.included is not None and group.block != head["hash"] \
+                    and self.admin.shell.blocks[group.included].hash() != group.block:
+                print(f"{op_hash} reorged out of block {group.included}")
+                metrics.inc("feeder_operations_total", status="reorged")
+                group.block, group.included = None, None
+                group.level = head["level"]  # back in the mempool, give it a new ttl
+            if group.included is None and head["level"] - group.level > self.ttl:
+                # heads skipped by the watcher or while the feeder was down may hold it, not the ones past
+                # its ttl: a restart after a long outage reads a few blocks per group, not the whole gap
+                for level in range(group.level + 1, min(head["level"], group.level + self.ttl + 1)):
+                    if self.inspect(self.admin.shell.blocks[level].hash(), level, retry, op_hash):
+                        break
+                if op_hash not in self.inflight:
+                    continue
+            if group.included is not None:
+                if head["level"] - group.included >= self.confirmations:
+                    confirmed.update(self.forget(op_hash).requests)
+                    metrics.inc("feeder_operations_total", status="confirmed")
+                    tracer.confirm(group.requests, group.included)
+            elif head["level"] - group.level > self.ttl:
+                print(f"{op_hash} dropped from the mempool")
+                retry.update(self.forget(op_hash).requests)
+                metrics.inc("feeder_operations_total", status="dropped")
+                self.counter = None  # every later counter is now in the future
+        if retry:
+            metrics.inc("feeder_retried_requests_total", len(retry))
+            tracer.drop(retry)
+        return confirmed, retry
+
+    def inspect(self, block: str, level: int, retry: dict, op_hash: str = None) -> bool:
+        # marks the groups included in the block, failed ones go to retry, returns whether op_hash was found
+        found: bool = False
+        for op in self.admin.shell.blocks[block].operations.managers():
+            if op["hash"] in self.inflight:
+                found = found or op["hash"] == op_hash
+                group: InFlight = self.inflight[op["hash"]]
+                group.block, group.included = block, level
+                if not OperationResult.is_applied(op):
+                    print(f"{op['hash']} failed: {OperationResult.errors(op)}")
+                    metrics.inc("feeder_operations_total", status="failed")
+                    retry.update(self.forget(op["hash"]).requests)
+                    self.limits.clear()  # the estimates may be outdated, simulate the next groups again
+        return found
+
+    def forget(self, op_hash: str) -> InFlight:
+        if self.checkpoint is not None:
+            self.checkpoint.forget(op_hash)
+        return self.inflight.pop(op_hash)
+
+    def request_ids(self) -> set:
+        return {request_id for group in self.inflight.values() for request_id in group.requests}
+
+    def __len__(self) -> int:
+        return len(self.inflight)
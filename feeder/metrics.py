@@ -0,0 +1,154 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic
+
+METRICS_PORT: int = 9108
+BUCKETS: tuple = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)  # seconds
+BLOCK_BUCKETS: tuple = (1, 2, 3, 5, 10, 20, 60)
+STAGES: tuple = ("discover", "fetch", "build", "inject", "confirm")
+MAX_SPANS: int = 10000  # open spans kept, requests answered by other workers never confirm here
+
+
+def labels_text(labels: tuple) -> str:
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}" if labels else ""
+
+
+class Metrics:
+    # counters, gauges and histograms rendered in the prometheus text format
+
+    def __init__(self):
+        self.lock = Lock()
+        self.types: dict = {}  # name -> counter, gauge or histogram
+        self.values: dict = {}  # (name, labels) -> value, or [bucket counts, sum, count] for histograms
+        self.buckets: dict = {}  # histogram name -> upper bounds
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key: tuple = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.types.setdefault(name, "counter")
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.types.setdefault(name, "gauge")
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, buckets: tuple = BUCKETS, **labels):
+        key: tuple = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.types.setdefault(name, "histogram")
+            bounds: tuple = self.buckets.setdefault(name, buckets)
+            histogram: list = self.values.setdefault(key, [[0] * len(bounds), 0, 0])
+            index: int = bisect_left(bounds, value)
+            if index < len(bounds):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        start: float = monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, monotonic() - start, **labels)
+
+    def render(self) -> str:
+        lines: list = []
+        with self.lock:
+            for name, kind in sorted(self.types.items()):
+                lines.append(f"# TYPE {name} {kind}")
+                for (key_name, labels), value in sorted(self.values.items()):
+                    if key_name != name:
+                        continue
+                    if kind != "histogram":
+                        lines.append(f"{name}{labels_text(labels)} {value}")
+                        continue
+                    counts, total, count = value
+                    cumulative: int = 0
+                    for bound, bucket in zip(self.buckets[name], counts):
+                        cumulative += bucket
+                        lines.append(f"{name}_bucket{labels_text(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{labels_text(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{labels_text(labels)} {total}")
+                    lines.append(f"{name}_count{labels_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = METRICS_PORT, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        registry: Metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body: bytes = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Tracer:
+    # per request spans discover -> fetch -> build -> inject -> confirm, closed into stage histograms
+    # once the update is confirmed, along with the blocks between the get_price and the update inclusions
+
+    def __init__(self, registry: Metrics, clock=monotonic, max_spans: int = MAX_SPANS):
+        self.metrics: Metrics = registry
+        self.clock = clock
+        self.max_spans: int = max_spans
+        self.spans: dict = {}  # request id -> {stage: time}
+        self.levels: dict = {}  # request id -> level of the get_price inclusion
+        self.lock = Lock()
+
+    def mark(self, request_ids, stage: str):
+        now: float = self.clock()
+        with self.lock:
+            for request_id in request_ids:
+                self.spans.setdefault(request_id, {})[stage] = now
+            while len(self.spans) > self.max_spans:  # oldest first
+                request_id = next(iter(self.spans))
+                del self.spans[request_id]
+                self.levels.pop(request_id, None)
+
+    def discover(self, request_id: int, level: int = None):
+        if level is not None:
+            self.levels[request_id] = level
+        self.mark([request_id], "discover")
+
+    def confirm(self, request_ids, level: int = None):
+        self.mark(request_ids, "confirm")
+        with self.lock:
+            spans: list = [(request_id, self.spans.pop(request_id)) for request_id in request_ids
+                           if request_id in self.spans]
+            included: list = [self.levels.pop(request_id, None) for request_id in request_ids]
+        for request_id, span in spans:
+            stages: list = [stage for stage in STAGES if stage in span]
+            for previous, stage in zip(stages, stages[1:]):
+                self.metrics.observe("feeder_stage_seconds", span[stage] - span[previous], stage=stage)
+            self.metrics.observe("feeder_request_seconds", span[stages[-1]] - span[stages[0]])
+        for first in included:
+            if first is not None and level is not None:
+                self.metrics.observe("feeder_fulfilment_blocks", level - first, buckets=BLOCK_BUCKETS)
+
+    def drop(self, request_ids):
+        # the request goes back to the scanner, its span restarts at the next fetch
+        with self.lock:
+            for request_id in request_ids:
+                span: dict = self.spans.get(request_id, {})
+                for stage in ("fetch", "build", "inject"):
+                    span.pop(stage, None)
+
+
+metrics = Metrics()
+tracer = Tracer(metrics)
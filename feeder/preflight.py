@@ -0,0 +1,22 @@
+from pytezos import MichelsonRuntimeError
+
+PERMANENT: tuple = ("This pair isn't supported",)  # failures no later head fixes
+
+
+def preflight(snapshot, sender: str, calls: list, now: int, retired: list = None) -> list:
+    # interprets every (request_id, request, update call) against the snapshot storage, the way the
+    # contract tests do, and keeps the calls that would succeed on chain; the ids of the requests
+    # failing for good are added to retired
+    # every call only carries its own request: interpret() encodes the whole storage, a storage holding
+    # the backlog would make every call cost as much as the backlog
+    valid: list = []
+    for request_id, request, call in calls:
+        try:
+            call.interpret(storage=snapshot.with_requests({request_id: request}), sender=sender, now=now)
+            valid.append((request_id, request, call))
+        except MichelsonRuntimeError as e:
+            error: str = e.format_stdout()
+            print(f"request {request_id} dropped: {error}")
+            if retired is not None and any(permanent in error for permanent in PERMANENT):
+                retired.append(request_id)
+    return valid
@@ -0,0 +1,90 @@
+from collections.abc import Mapping
+from decimal import Decimal
+from json import dumps
+from feeder.sessions import pool
+
+try:
+    from orjson import loads
+except ImportError:  # optional, the stdlib decoder gives the same objects, only slower
+    from json import loads
+
+binance: str = 'https://api.binance.com'
+
+DECIMALS: int = 8  # prices and volumes are nats with 8 decimals on chain
+PADDING: str = "0" * DECIMALS
+FIELDS: tuple = ("pair", "open_time", "close_time", "last_price", "low_price", "high_price", "volume", "quote_volume")
+
+
+class Quote(Mapping):
+    # update entrypoint price fields of a pair, reads like the dict it replaces: quote["last_price"], {**quote}
+    __slots__ = FIELDS
+
+    def __init__(self, pair: str, open_time: int, close_time: int, last_price: int, low_price: int, high_price: int,
+                 volume: int, quote_volume: int):
+        self.pair: str = pair
+        self.open_time: int = open_time
+        self.close_time: int = close_time
+        self.last_price: int = last_price
+        self.low_price: int = low_price
+        self.high_price: int = high_price
+        self.volume: int = volume
+        self.quote_volume: int = quote_volume
+
+    def __getitem__(self, field: str):
+        if field not in FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def __repr__(self) -> str:
+        return f"Quote({dict(self)})"
+
+
+def scale(value) -> int:
+    # exact decimal string -> nat with 8 decimals, no float step, the decimals past the 8th are truncated
+    value = value if isinstance(value, str) else str(value)
+    try:
+        if value[-9:-8] == ".":  # binance always sends 8 decimals
+            return int(value.replace(".", ""))
+        whole, _, fraction = value.partition(".")
+        return int(whole + (fraction + PADDING)[:DECIMALS])
+    except ValueError:  # exponent notation, "1.2345e-05" passes the 8 decimals check
+        return int(Decimal(value).scaleb(DECIMALS))
+
+
+def fetch_symbols(url: str = binance, http_get=pool.get) -> set:
+    # symbols the exchange trades, the ticker call rejects the whole list when one of them isn't listed
+    res = http_get(url=f"{url}/api/v3/exchangeInfo", params={"symbolStatus": "TRADING"})
+    res.raise_for_status()
+    return {symbol["symbol"] for symbol in loads(res.content)["symbols"] if symbol["status"] == "TRADING"}
+
+
+def fetch_tickers(pairs: list, url: str = binance, http_get=pool.get, listed: set = None) -> dict:
+    # one multi-symbol 24h ticker call for every pair the exchange lists, returns pair -> ticker
+    if listed is not None:
+        pairs = [pair for pair in pairs if pair in listed]
+    if not pairs:
+        return {}
+    res = http_get(url=f"{url}/api/v3/ticker/24hr",
+                   params={"symbols": dumps(sorted(pairs), separators=(",", ":"))})
+    res.raise_for_status()
+    return {ticker["symbol"]: ticker for ticker in loads(res.content)}
+
+
+def to_quote(res: dict) -> Quote:
+    # binance 24h ticker -> update entrypoint price fields
+    return Quote(
+        res["symbol"],
+        int(res["openTime"]) // 1000,
+        int(res["closeTime"]) // 1000,
+        scale(res["lastPrice"]),
+        scale(res["lowPrice"]),
+        scale(res["highPrice"]),
+        scale(res["volume"]),
+        scale(res["quoteVolume"])
+    )
@@ -0,0 +1,106 @@
+from functools import partial
+from feeder.metrics import tracer
+from feeder.sessions import pool
+
+tzkt: str = 'https://api.hangzhounet.tzkt.io'
+
+PAGE_SIZE: int = 1000  # tzkt accepts up to 10000 keys per page
+
+
+class PendingRequests:
+    # in-memory index of the oracle requests still waiting for an update,
+    # filled from the indexer with a handful of paged calls instead of one call per id
+
+    def __init__(self, big_map_id: int, url: str = tzkt, page_size: int = PAGE_SIZE, http_get=pool.get, owns=None):
+        self.big_map_id: int = big_map_id
+        self.url: str = url
+        self.page_size: int = page_size
+        self.http_get = http_get
+        self.owns = owns  # request id -> whether this worker serves it, the others are never indexed
+        self.last_seen: int = -1  # highest request id already indexed
+        self.requests: dict = {}  # request id -> request
+        self.by_pair: dict = {}  # pair -> set of request ids
+        self.levels: dict = {}  # request id -> level of its get_price inclusion, as indexed
+
+    def scan(self) -> int:
+        # page through every unserved key above last_seen, returns the number of new requests
+        found: int = 0
+        while True:
+            page: list = self.http_get(url=f"{self.url}/v1/bigmaps/{self.big_map_id}/keys", params={
+                "active": "true",
+                "value.status": "false",
+                "key.gt": self.last_seen,
+                "sort.asc": "id",
+                "select": "key,value,firstLevel",
+                "limit": self.page_size
+            }).json()
+            for entry in page:
+                request_id: int = int(entry["key"])
+                self.last_seen = max(self.last_seen, request_id)
+                if self.owns is not None and not self.owns(request_id):
+                    continue
+                self.add(request_id, entry["value"], entry.get("firstLevel"))
+                tracer.discover(request_id, entry.get("firstLevel"))  # level of the get_price inclusion
+                found += 1
+            if len(page) < self.page_size:
+                return found
+
+    def scan_range(self, first: int, last: int, gather=pool.gather) -> int:
+        # indexes the unserved keys from first to last included, request ids are consecutive so a window of
+        # page_size ids is one page, and the windows are fetched concurrently; returns the keys already served
+        windows: list = [(low, min(low + self.page_size - 1, last)) for low in range(first, last + 1, self.page_size)]
+        pages: list = gather([partial(self.http_get, url=f"{self.url}/v1/bigmaps/{self.big_map_id}/keys", params={
+            "active": "true",
+            "key.ge": low,
+            "key.le": high,
+            "sort.asc": "id",
+            "select": "key,value,firstLevel",
+            "limit": self.page_size
+        }) for low, high in windows])
+        served: int = 0
+        for page in pages:
+            if isinstance(page, Exception):  # a missing window would look like served requests
+                raise page
+            for entry in page.json():
+                if entry["value"]["status"]:
+                    served += 1
+                else:
+                    self.add(int(entry["key"]), entry["value"], entry.get("firstLevel"))
+        return served
+
+    def add(self, request_id: int, request: dict, level: int = None):
+        self.requests[request_id] = request
+        if level is not None:
+            self.levels[request_id] = level
+        self.by_pair.setdefault(request["pair"], set()).add(request_id)
+
+    def remove(self, request_id: int):
+        request: dict = self.requests.pop(request_id, None)
+        self.levels.pop(request_id, None)
+        if request is None:
+            return
+        ids: set = self.by_pair[request["pair"]]
+        ids.discard(request_id)
+        if not ids:
+            del self.by_pair[request["pair"]]
+
+    def settled(self, request_id: int, level: int) -> bool:
+        # whether the request was made at or before the level, the indexer may be ahead of the head
+        # being processed; requests handed back by the injector were served once, they are older
+        indexed: int = self.levels.get(request_id)
+        return indexed is None or level is not None and indexed <= level
+
+    def retain(self, owns):
+        # drops the requests of the shards another worker serves now
+        for request_id in [request_id for request_id in self.requests if not owns(request_id)]:
+            self.remove(request_id)
+
+    def pending(self, by_pair: bool = False) -> list:
+        # oldest first, or pair after pair to keep the requests of a pair in the same batches
+        if by_pair:
+            return [(request_id, self.requests[request_id])
+                    for pair in sorted(self.by_pair) for request_id in sorted(self.by_pair[pair])]
+        return sorted(self.requests.items())
+
+    def __len__(self) -> int:
+        return len(self.requests)
@@ -0,0 +1,103 @@
+from collections import deque
+from feeder.scanner import tzkt
+from feeder.sessions import pool
+
+HOT: float = 0.5  # requests per block above which a pair is refreshed ahead of demand
+DECAY: float = 0.9  # weight of the past blocks in the demand average
+BUDGET: int = 1_000_000  # mutez the refreshes may spend per window, request price and fees included
+WINDOW: int = 120  # blocks, about one hour on hangzhou
+REFRESH_FEE: int = 5_000  # mutez of fees for a refresh request and its update
+PAGE_SIZE: int = 1000
+
+
+class RefreshScheduler:
+    # follows how often each pair is requested and asks the oracle for the hot pairs ahead of demand:
+    # the update serving the feeder's own request lands in the next block, and the get_price calls
+    # following it in that block are answered inline instead of being queued
+    # update only accepts an existing request id, hence a request of our own instead of a bare update
+
+    def __init__(self, big_map_id: int, target: str, budget: int = BUDGET, window: int = WINDOW, hot: float = HOT,
+                 decay: float = DECAY, url: str = tzkt, http_get=pool.get):
+        self.big_map_id: int = big_map_id
+        self.target: str = target  # address%entrypoint of the feeder's own client receiving the refreshes
+        self.budget: int = budget
+        self.window: int = window
+        self.hot: float = hot
+        self.decay: float = decay
+        self.url: str = url
+        self.http_get = http_get
+        self.level: int = None  # last level observed
+        self.demand: dict = {}  # pair -> requests per block
+        self.spent: deque = deque()  # (level, mutez) of the refreshes of the window
+        self.inline: int = 0
+        self.queued: int = 0
+
+    def observe(self, level: int):
+        # reads the requests added since the last observed level, from everybody but the feeder itself
+        if self.level is None:
+            self.level = level  # demand is followed from the start of the feeder on
+            return
+        if level <= self.level:
+            return
+        counts: dict = {}
+        offset: int = 0
+        while True:
+            page: list = self.http_get(url=f"{self.url}/v1/bigmaps/updates", params={
+                "bigmap": self.big_map_id,
+                "action": "add_key",
+                "level.gt": self.level,
+                "level.le": level,
+                "sort.asc": "id",
+                "select": "content",
+                "offset": offset,
+                "limit": PAGE_SIZE
+            }).json()
+            for content in page:
+                request: dict = content["value"]
+                if f"{request['target_address']}%{request['target_entrypoint']}" == self.target:
+                    continue
+                counts[request["pair"]] = counts.get(request["pair"], 0) + 1
+                if request["status"]:  # answered by get_price itself
+                    self.inline += 1
+                else:
+                    self.queued += 1
+            offset += len(page)
+            if len(page) < PAGE_SIZE:
+                break
+        blocks: int = level - self.level
+        self.level = level
+        weight: float = self.decay ** blocks  # of the past, the rate of the new blocks gets the rest
+        for pair in set(self.demand) | set(counts):
+            self.demand[pair] = weight * self.demand.get(pair, 0) + (1 - weight) * counts.get(pair, 0) / blocks
+
+    def plan(self, level: int, supported_pairs: set, pending_pairs: set, cost: int) -> list:
+        # hottest pairs first, as long as the budget of the window allows it, charged by spend() once injected
+        # pairs with a pending request get a fresh update anyway
+        while self.spent and self.spent[0][0] <= level - self.window:
+            self.spent.popleft()
+        left: int = self.budget - sum(mutez for _, mutez in self.spent)
+        pairs: list = []
+        for pair, demand in sorted(self.demand.items(), key=lambda item: -item[1]):
+            if demand < self.hot or left < cost:
+                break
+            if pair in supported_pairs and pair not in pending_pairs:
+                pairs.append(pair)
+                left -= cost
+        return pairs
+
+    def spend(self, level: int, pairs: list, cost: int):
+        self.spent.extend((level, cost) for _ in pairs)
+
+    def requests(self, contract, pairs: list, request_price: int) -> list:
+        address, entrypoint = self.target.split("%")
+        return [contract.get_price({
+            "pair": pair,
+            "target": self.target,
+            "target_address": address,
+            "target_entrypoint": entrypoint
+        }).with_amount(request_price) for pair in pairs]
+
+    def ratio(self) -> float:
+        # share of the requests answered inline by get_price
+        answered: int = self.inline + self.queued
+        return self.inline / answered if answered else 0.0
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import urlsplit
+from requests import Session
+from requests.adapters import HTTPAdapter
+from pytezos.rpc import RpcNode
+from pytezos.rpc.node import RpcError, RpcNotFoundError
+from feeder.metrics import metrics
+
+TIMEOUT: int = 10  # default per-call timeout in seconds
+POOL_SIZE: int = 16  # keep-alive connections kept per host
+WORKERS: int = 16  # calls running at the same time in gather
+
+
+class HttpPool:
+    # keep-alive sessions shared by every rpc, indexer and exchange call of the feeder, one per host
+
+    def __init__(self, timeout: int = TIMEOUT, pool_size: int = POOL_SIZE, workers: int = WORKERS):
+        self.timeout: int = timeout
+        self.pool_size: int = pool_size
+        self.sessions: dict = {}
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def session(self, url: str) -> Session:
+        host: str = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.sessions:
+                session = Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def request(self, method: str, url: str, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        host: str = urlsplit(url).netloc
+        try:
+            with metrics.time("feeder_http_seconds", host=host):
+                return self.session(url).request(method=method, url=url, **kwargs)
+        except Exception:
+            metrics.inc("feeder_http_errors_total", host=host)
+            raise
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def gather(self, calls: list) -> list:
+        # runs every call concurrently, a failed call gives its exception in place of its result
+        futures: list = [self.executor.submit(call) for call in calls]
+        results: list = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class PooledNode(RpcNode):
+    # pytezos node going through the shared keep-alive sessions instead of a new connection per call
+
+    def __init__(self, uri: str, pool: HttpPool):
+        super().__init__(uri)
+        self.pool: HttpPool = pool
+
+    def request(self, method: str, path: str, **kwargs):
+        res = self.pool.request(
+            method,
+            f"{self.uri[0].rstrip('/')}/{path.lstrip('/')}",
+            headers={'content-type': 'application/json', 'user-agent': 'PyTezos', **self.headers},
+            timeout=kwargs.pop("timeout", None) or self.pool.timeout,
+            **kwargs
+        )
+        if res.status_code == 404:
+            raise RpcNotFoundError(f'Not found: {path}')
+        if res.status_code != 200:
+            raise RpcError.from_response(res)
+        return res
+
+
+pool = HttpPool()
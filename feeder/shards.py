@@ -0,0 +1,59 @@
+from fcntl import LOCK_EX, LOCK_UN, flock
+from json import dumps, loads
+from time import time
+
+LEASE_TTL: int = 120  # seconds without renewal before a shard is taken over by another worker
+
+
+class Leases:
+    # request ids are split in shards by request_id mod shards, every worker has a home shard
+    # and renews its leases on every head in a lease file shared by the workers of the host,
+    # shards whose owner stopped renewing are picked up by the other workers of the host;
+    # the lease file isn't shared across hosts, the shards of the other hosts are never taken over
+
+    def __init__(self, path: str, home: int, shards: int, local: range = None, worker: str = None,
+                 ttl: int = LEASE_TTL, clock=time):
+        self.path: str = path
+        self.home: int = home
+        self.shards: int = shards
+        self.local: range = local if local is not None else range(0, shards)  # home shards of this host
+        self.worker: str = worker or f"home {home}"  # stable across restarts, like the checkpoint of the shard
+        self.ttl: int = ttl
+        self.clock = clock
+        self.started: float = clock()
+        self.owned: set = {home}
+
+    def renew(self, busy: set = frozenset()) -> set:
+        # takes the lock, keeps every shard owned or expired, returns the owned shards; a shard of this host
+        # without any lease is claimed once its worker had a ttl to start; a home shard held by a live worker
+        # is asked back, the holder hands it over once none of its groups for it is in flight (busy)
+        with open(self.path, "a+") as f:
+            flock(f, LOCK_EX)
+            try:
+                f.seek(0)
+                content: str = f.read()
+                leases: dict = {int(shard): lease for shard, lease in loads(content).items()} if content else {}
+                now: float = self.clock()
+                for shard in self.local:
+                    lease: dict = leases.get(shard)
+                    if lease is not None and lease["owner"] == self.worker:
+                        if lease.get("claim") is not None and shard not in busy:  # its home worker is back
+                            leases[shard] = {"owner": lease["claim"], "expires": now + self.ttl}
+                        else:
+                            leases[shard] = {**lease, "expires": now + self.ttl}
+                    elif lease is None and (shard == self.home or now - self.started > self.ttl) \
+                            or lease is not None and lease["expires"] < now:
+                        leases[shard] = {"owner": self.worker, "expires": now + self.ttl}
+                    elif shard == self.home:
+                        lease["claim"] = self.worker
+                f.seek(0)
+                f.truncate()
+                f.write(dumps(leases))
+                f.flush()
+            finally:
+                flock(f, LOCK_UN)
+        self.owned = {shard for shard, lease in leases.items() if lease["owner"] == self.worker}
+        return self.owned
+
+    def owns(self, request_id: int) -> bool:
+        return request_id % self.shards in self.owned
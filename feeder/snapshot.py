@@ -0,0 +1,32 @@
+class StorageSnapshot:
+    # oracle storage read once per block head, every decision of a tick reads the same block
+
+    def __init__(self, contract):
+        self.contract = contract
+        self.head: str = None  # hash of the block the snapshot was read at
+        self.level: int = None
+        self.storage: dict = {}
+        self.counter: int = 0
+        self.supported_pairs: set = set()
+        self.whitelist: set = set()
+        self.prices: dict = {}
+
+    def load(self, head: str, level: int = None) -> bool:
+        # one rpc call when the head changed, returns whether the snapshot was reloaded; the storage is read
+        # at the block hash, so a reorg, which changes the head hash, reloads it without any invalidation
+        if head == self.head:
+            return False
+        expr = self.contract.shell.blocks[head].context.contracts[self.contract.address].storage()
+        storage: dict = self.contract.program.storage.from_micheline_value(expr).to_python_object()
+        self.counter = int(storage["counter"])
+        self.supported_pairs = set(storage["supported_pairs"])
+        self.whitelist = set(storage["whitelist"])
+        self.prices = storage["prices"]
+        self.storage = storage
+        self.head = head
+        self.level = level
+        return True
+
+    def with_requests(self, requests: dict) -> dict:
+        # the snapshot storage with the given requests in place of the big_map id, to interpret calls locally
+        return {**self.storage, "requests": requests}
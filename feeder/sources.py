@@ -0,0 +1,145 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from statistics import median_low
+from time import monotonic
+from requests import HTTPError
+from feeder.prices import Quote, binance, fetch_symbols, fetch_tickers, loads, to_quote
+from feeder.sessions import pool
+
+kucoin: str = 'https://api.kucoin.com'
+
+BUDGET: float = 2.0  # seconds the feeder waits at most for the quotes of a tick
+HEDGE_AFTER: float = 0.5  # seconds before firing the next source while a source has no latency history yet
+HEDGE_PERCENTILE: float = 0.95  # a source slower than this percentile of its own latencies gets hedged
+HISTORY: int = 100  # latencies kept per source
+LISTING_TTL: float = 3600  # seconds the symbols listed by an exchange are trusted
+
+
+class QuoteSource:
+    # an exchange adapter, fetch returns pair -> quote for the pairs the exchange lists
+    name: str = ""
+
+    def fetch(self, pairs: list, timeout: float) -> dict:
+        raise NotImplementedError
+
+
+class Binance(QuoteSource):
+
+    def __init__(self, url: str = binance, listing_ttl: float = LISTING_TTL, clock=monotonic):
+        self.name = url
+        self.url: str = url
+        self.listing_ttl: float = listing_ttl
+        self.clock = clock
+        self.symbols: set = None  # listed symbols, unknown ones are left out of the ticker call
+        self.listed_at: float = None
+
+    def fetch(self, pairs: list, timeout: float) -> dict:
+        http_get = lambda **kwargs: pool.get(timeout=timeout, **kwargs)
+        if self.symbols is None or self.clock() - self.listed_at > self.listing_ttl:
+            self.symbols, self.listed_at = fetch_symbols(self.url, http_get), self.clock()
+        try:
+            tickers: dict = fetch_tickers(pairs, self.url, http_get, self.symbols)
+        except HTTPError as e:
+            if e.response is not None and e.response.status_code == 400:  # invalid symbol: delisted since read
+                self.symbols = None
+            raise
+        return {pair: to_quote(ticker) for pair, ticker in tickers.items()}
+
+
+class KuCoin(QuoteSource):
+
+    def __init__(self, url: str = kucoin):
+        self.name = url
+        self.url: str = url
+
+    def fetch(self, pairs: list, timeout: float) -> dict:
+        res = pool.get(url=f"{self.url}/api/v1/market/allTickers", timeout=timeout)
+        res.raise_for_status()
+        data: dict = loads(res.content)["data"]
+        wanted: set = set(pairs)
+        quotes: dict = {}
+        for ticker in data["ticker"]:
+            pair: str = ticker["symbol"].replace("-", "")
+            if pair in wanted and ticker["last"] is not None:
+                quotes[pair] = to_quote({
+                    "symbol": pair,
+                    "openTime": data["time"] - 86_400_000,  # rolling 24h window ending now
+                    "closeTime": data["time"],
+                    "lastPrice": ticker["last"],
+                    "lowPrice": ticker["low"],
+                    "highPrice": ticker["high"],
+                    "volume": ticker["vol"],
+                    "quoteVolume": ticker["volValue"]
+                })
+        return quotes
+
+
+class HedgedQuotes:
+    # asks the sources in order, fires the next one when the running ones are slower than usual
+    # or leave pairs without quorum quotes, and returns the median of the quotes received within
+    # the latency budget
+
+    def __init__(self, sources: list, quorum: int = 1, budget: float = BUDGET, percentile: float = HEDGE_PERCENTILE,
+                 executor=None, clock=monotonic):
+        self.sources: list = sources
+        self.quorum: int = quorum  # quotes needed for every pair before returning early
+        self.budget: float = budget
+        self.percentile: float = percentile
+        self.executor = executor or pool.executor
+        self.clock = clock
+        self.latencies: dict = {source.name: deque(maxlen=HISTORY) for source in sources}
+
+    def hedge_after(self, source: QuoteSource) -> float:
+        latencies: list = sorted(self.latencies[source.name])
+        if not latencies:
+            return HEDGE_AFTER
+        return latencies[int(self.percentile * (len(latencies) - 1))]
+
+    def timed(self, source: QuoteSource, pairs: list, timeout: float) -> dict:
+        start: float = self.clock()
+        quotes: dict = source.fetch(pairs, timeout)
+        self.latencies[source.name].append(self.clock() - start)
+        return quotes
+
+    def fetch(self, pairs: list) -> dict:
+        start: float = self.clock()
+        queued: list = list(self.sources)
+        running: dict = {}  # future -> source
+        answers: list = []
+        hedge_at: float = start
+        while True:
+            now: float = self.clock()
+            left: float = self.budget - (now - start)
+            # a source may not list every pair, the quorum holds per pair
+            short: bool = any(sum(pair in answer for answer in answers) < self.quorum for pair in pairs)
+            if answers and not short or left <= 0:
+                break
+            if queued and (now >= hedge_at or len(running) + len(answers) < self.quorum or not running):
+                source: QuoteSource = queued.pop(0)
+                running[self.executor.submit(self.timed, source, pairs, left)] = source
+                hedge_at = now + self.hedge_after(source)
+                continue
+            if not running:
+                break
+            done, _ = wait(running, timeout=min(left, max(hedge_at - now, 0)) if queued else left,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                source = running.pop(future)
+                try:
+                    answers.append(future.result())
+                except Exception as e:
+                    print(f"{source.name}: {e}")
+        if not answers:
+            raise TimeoutError(f"no quote source answered within {self.budget}s")
+        return median_quotes(answers)
+
+
+def median_quotes(answers: list) -> dict:
+    # field by field median of every source quoting the pair, median_low keeps the nats exact
+    quotes: dict = {}
+    for pair in {pair for answer in answers for pair in answer}:
+        quoted: list = [answer[pair] for answer in answers if pair in answer]
+        quotes[pair] = Quote(pair, **{
+            field: median_low([quote[field] for quote in quoted]) for field in quoted[0] if field != "pair"
+        })
+    return quotes
@@ -0,0 +1,94 @@
+import asyncio
+from threading import Thread
+from time import monotonic
+from feeder.heads import backoff
+from feeder.prices import loads, to_quote
+
+try:
+    import websockets
+except ImportError:  # optional, without it the feeder only uses the rest tickers
+    websockets = None
+
+binance_stream: str = 'wss://stream.binance.com:9443'
+
+STALE: float = 10  # seconds without a push before a pair falls back to the rest tickers
+
+
+class TickerStream:
+    # latest 24h ticker of every subscribed pair, pushed by the exchange websocket
+    # and read by the feeder without any network wait
+
+    def __init__(self, url: str = binance_stream, stale: float = STALE, clock=monotonic):
+        if websockets is None:
+            raise ImportError("the streaming price feed needs the websockets package")
+        self.url: str = url
+        self.stale: float = stale
+        self.clock = clock
+        self.pairs: frozenset = frozenset()
+        self.quotes: dict = {}  # pair -> (received at, quote)
+        self.loop = asyncio.new_event_loop()
+        self.connection = None
+        self.running: bool = False
+
+    def start(self, pairs):
+        self.pairs = frozenset(pairs)
+        self.running = True
+        Thread(target=self.loop.run_until_complete, args=(self.run(),), daemon=True).start()
+
+    def subscribe(self, pairs):
+        # reconnects with the new streams when the supported pairs changed
+        pairs = frozenset(pairs)
+        if pairs != self.pairs:
+            self.pairs = pairs
+            self.reconnect()
+
+    def reconnect(self):
+        if self.connection is not None:
+            asyncio.run_coroutine_threadsafe(self.connection.close(), self.loop)
+
+    def close(self):
+        self.running = False
+        self.reconnect()
+
+    async def run(self):
+        failures: int = 0
+        while self.running:
+            try:
+                if not self.pairs:
+                    await asyncio.sleep(1)
+                    continue
+                streams: str = "/".join(f"{pair.lower()}@ticker" for pair in sorted(self.pairs))
+                async with websockets.connect(f"{self.url}/stream?streams={streams}") as connection:
+                    self.connection = connection
+                    failures = 0
+                    async for message in connection:
+                        self.push(loads(message)["data"])
+            except Exception as e:
+                print(str(e))
+                failures += 1
+                await asyncio.sleep(backoff(failures))
+            finally:
+                self.connection = None
+
+    def push(self, data: dict):
+        # websocket ticker event -> same quote as the rest ticker
+        self.quotes[data["s"]] = (self.clock(), to_quote({
+            "symbol": data["s"],
+            "openTime": data["O"],
+            "closeTime": data["C"],
+            "lastPrice": data["c"],
+            "lowPrice": data["l"],
+            "highPrice": data["h"],
+            "volume": data["v"],
+            "quoteVolume": data["q"]
+        }))
+
+    def get_many(self, pairs: list) -> dict:
+        # fresh quotes only, the caller fetches the other pairs over rest
+        now: float = self.clock()
+        quotes: dict = {}
+        for pair in pairs:
+            entry = self.quotes.get(pair)
+            if entry is not None and now - entry[0] < self.stale:
+                quotes[pair] = entry[1]
+        return quotes
@@ -0,0 +1,490 @@
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from contextlib import redirect_stdout
+from json import dumps, loads
+from os import devnull
+from os.path import abspath, dirname, join
+from random import Random
+from tempfile import TemporaryDirectory
+from threading import Condition, Event, Thread
+from time import sleep, time
+from types import SimpleNamespace
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+from pytezos import MichelsonRuntimeError
+from requests import HTTPError
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))  # run as a script from this test folder too
+import data_feed
+from feeder.injector import OPERATION_TTL
+from feeder.scanner import tzkt
+from feeder.sessions import pool
+from feeder.sources import Binance, KuCoin
+from oracle_harness import load_oracle
+
+# offline stand-ins for the node, tzkt and the exchanges, the feeder runs unchanged against them:
+#   python bench_feeder.py --blocks 30 --rate 5 --pairs BTCUSDT=3,XTZUSDT=1 --ticker-errors 0.1
+
+compiled_contract_path = "Oracle.tz"
+
+oracle_address = "KT1HJmhtdDw88kCEEiyaw6iYwzPsTphxzzRz"
+feeder_address = "tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK"
+client_address = "KT1BEqzn5Wx8uJrZNvuS9DVHmLvG9td3fDLi"
+users = ['tz1hNVs94TTjZh6BZ1PM5HL83A7aiZXkQ8ur', 'tz1c6PPijJnZYjKiSQND4pMtGMg6csGeAiiF',
+         'tz1Phy92c2n817D17dUGzxNgw1qCkNSTWZY2', 'tz1XH5UyhRCUmCdUUbqD4tZaaqRTgGaFXt7q']
+big_map_id = 84085
+node = "http://node.bench"
+binance = "http://binance.bench"
+kucoin = "http://kucoin.bench"
+
+REQUEST_PRICE: int = 1000  # mutez
+GAS_PER_CALL: int = 4000  # what the simulation hands back per update call
+STORAGE_PER_CALL: int = 100
+FILL_RPCS: int = 2  # branch and protocol reads of pytezos' fill
+DRAIN: int = 10  # blocks baked at most after the load stops, until every request is served
+
+
+class Response:
+    # the parts of requests.Response the feeder reads
+
+    def __init__(self, status_code: int = 200, body=None, lines=()):
+        self.status_code = status_code
+        self.body = body
+        self.lines = lines
+
+    def json(self):
+        return self.body
+
+    @property
+    def content(self) -> bytes:
+        return dumps(self.body).encode()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(f"{self.status_code} from the bench stand-in", response=self)
+
+    def iter_lines(self):
+        return self.lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class Call:
+    # contract call with the big_map keys it touches, the chain only hands those keys to the interpreter
+
+    def __init__(self, call, keys, amount: int = 0):
+        self.call = call
+        self.keys = keys  # storage -> request ids read or written by the call
+        self.amount: int = amount
+        self.parameters: dict = call.parameters
+
+    def interpret(self, **kwargs):
+        return self.call.interpret(**kwargs)
+
+
+class Group:
+    # operation group as built by pytezos' bulk, injected into the chain mempool
+
+    def __init__(self, chain, source: str, calls: list):
+        self.chain = chain
+        self.source: str = source
+        self.calls: list = list(calls)
+        self.contents: list = []
+        self.op_hash: str = None
+        self.level: int = None  # level at injection time
+        self.first: int = None  # counter of the first content, None for the load generator's groups
+
+    def autofill(self, ttl: int, **limits):
+        self.chain.rpc("run_operation")
+        return self.fill(ttl, gas_limit=GAS_PER_CALL * len(self.calls), storage_limit=STORAGE_PER_CALL * len(self.calls))
+
+    def fill(self, ttl: int, counter: int = None, gas_limit: int = 0, storage_limit: int = 0):
+        for _ in range(FILL_RPCS):
+            self.chain.rpc("fill")
+        self.contents = [{
+            "kind": "transaction",
+            "source": self.source,
+            "fee": "0",
+            "counter": str((counter or 0) + i),
+            "gas_limit": str(gas_limit // len(self.calls)),
+            "storage_limit": str(storage_limit // len(self.calls)),
+            "amount": str(call.amount),
+            "destination": oracle_address,
+            "parameters": call.parameters
+        } for i, call in enumerate(self.calls)]
+        return self
+
+    def sign(self):
+        self.op_hash = self.chain.next_hash()
+        return self
+
+    def hash(self) -> str:
+        return self.op_hash
+
+    def inject(self, min_confirmations: int = 0):
+        self.chain.rpc("injection")
+        self.first = int(self.contents[0]["counter"])
+        self.chain.submit(self)
+        return self.op_hash
+
+
+class Chain:
+    # in-memory node running the oracle through the interpreter, bake() turns the mempool into a block
+
+    def __init__(self, interface, pairs: list, ttl: int = OPERATION_TTL, node_latency: float = 0):
+        self.interface = interface
+        self.ttl: int = ttl
+        self.node_latency: float = node_latency
+        self.storage: dict = interface.storage.dummy()
+        self.storage.update(admin=feeder_address, counter=0, request_price=REQUEST_PRICE, supported_pairs=list(pairs),
+                            whitelist=[feeder_address])
+        self.storage.pop("requests")
+        self.requests: dict = {}  # the whole requests big_map
+        self.created: dict = {}  # request id -> (level, time) of the get_price inclusion
+        self.served: dict = {}  # request id -> (level, time) of the update inclusion
+        self.inline: int = 0  # requests answered by get_price itself
+        self.level: int = 0
+        self.hashes: list = ["BL0"]
+        self.blocks: dict = {"BL0": []}  # block hash -> manager operations
+        self.storages: dict = {"BL0": dict(self.storage)}  # block hash -> storage without the big_map
+        self.updates: list = []  # update calls applied per block
+        self.counters: dict = {}  # source -> last counter used
+        self.mempool: list = []
+        self.failed: int = 0
+        self.operations: int = 0
+        self.calls: Counter = Counter()  # rpc -> calls
+        self.idle: int = None  # last head the feeder finished working on
+        self.condition = Condition()
+
+    def rpc(self, name: str, result=None):
+        self.calls[name] += 1
+        if self.node_latency:
+            sleep(self.node_latency)
+        return result
+
+    def next_hash(self) -> str:
+        with self.condition:
+            self.operations += 1
+            return f"oo{self.operations}"
+
+    def submit(self, group: Group):
+        with self.condition:
+            group.level = self.level
+            self.mempool.append(group)
+
+    def bake(self):
+        with self.condition:
+            level: int = self.level + 1
+            now: float = time()
+            operations: list = []
+            waiting: list = []
+            updates: int = 0
+            for group in sorted(self.mempool, key=lambda g: (g.source, g.first or 0)):
+                if group.first is not None:
+                    expected: int = self.counters.get(group.source, 0) + 1
+                    if group.first > expected:  # waits for the groups before it, until its ttl
+                        if level - group.level <= self.ttl:
+                            waiting.append(group)
+                        continue
+                    if group.first < expected:  # counter already used, the node refuses it
+                        continue
+                    self.counters[group.source] = group.first + len(group.calls) - 1
+                applied: bool = self.apply(group, level, now)
+                if applied and group.first is not None:
+                    updates += len(group.calls)
+                self.failed += not applied
+                operations.append({"hash": group.op_hash, "contents": [{
+                    "kind": "transaction",
+                    "metadata": {"operation_result": {"status": "applied" if applied else "failed"}}
+                } for _ in group.calls]})
+            block: str = f"BL{level}"
+            self.mempool = waiting
+            self.blocks[block] = operations
+            self.storages[block] = dict(self.storage)
+            self.hashes.append(block)
+            self.updates.append(updates)
+            self.level = level
+            self.condition.notify_all()
+
+    def apply(self, group: Group, level: int, now: float) -> bool:
+        # every call of the group or none, like the node does
+        storage: dict = dict(self.storage)
+        touched: dict = {}
+        try:
+            for call in group.calls:
+                keys: list = call.keys(storage)
+                requests: dict = {key: touched.get(key, self.requests.get(key)) for key in keys
+                                  if key in touched or key in self.requests}
+                res = call.interpret(storage={**storage, "requests": requests}, sender=group.source,
+                                     amount=call.amount, now=int(now))
+                storage = res.storage
+                touched.update(storage.pop("requests"))
+        except MichelsonRuntimeError:
+            return False
+        self.storage = storage
+        for request_id, request in touched.items():
+            if request_id not in self.requests:
+                self.created[request_id] = (level, now)
+                self.inline += request["status"]
+            elif request["status"] and not self.requests[request_id]["status"]:
+                self.served[request_id] = (level, now)
+            self.requests[request_id] = request
+        return True
+
+    def head(self) -> dict:
+        return {"hash": self.hashes[-1], "level": self.level}
+
+    def heads(self):
+        # /monitor/heads/main: the current head, then every new one, idle tells the feeder is done with a head
+        seen: int = None
+        while True:
+            with self.condition:
+                self.idle = seen
+                self.condition.notify_all()
+                self.condition.wait_for(lambda: self.level != seen)
+                head: dict = self.head()
+            seen = head["level"]
+            yield dumps(head).encode()
+
+    def wait_idle(self, timeout: float) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: self.idle == self.level, timeout)
+
+    def keys(self, params: dict, lag: int) -> list:
+        # tzkt /v1/bigmaps/{id}/keys as seen lag blocks behind the node
+        visible: int = self.level - lag
+        after: int = int(params["key.gt"])
+        page: list = []
+        with self.condition:
+            for request_id in sorted(self.requests):
+                if request_id <= after or self.created[request_id][0] > visible:
+                    continue
+                served: bool = self.requests[request_id]["status"] and \
+                    (request_id not in self.served or self.served[request_id][0] <= visible)
+                if served:
+                    continue
+                page.append({"key": str(request_id), "value": {**self.requests[request_id], "status": False},
+                             "firstLevel": self.created[request_id][0]})
+                if len(page) == params["limit"]:
+                    break
+        return page
+
+    def micheline(self, block: str):
+        return self.interface.program.storage.from_python_object(
+            {**self.storages[block], "requests": big_map_id}).to_micheline_value()
+
+
+class Block:
+    # shell.blocks[level or hash]
+
+    def __init__(self, chain: Chain, block):
+        self.chain = chain
+        self.block: str = block if isinstance(block, str) else chain.hashes[block]
+        self.operations = SimpleNamespace(managers=lambda: chain.rpc("operations", chain.blocks[self.block]))
+        self.context = SimpleNamespace(contracts={
+            oracle_address: SimpleNamespace(storage=lambda: chain.rpc("storage", chain.micheline(self.block)))
+        })
+
+    def hash(self) -> str:
+        return self.chain.rpc("hash", self.block)
+
+
+class Blocks:
+
+    def __init__(self, chain: Chain):
+        self.chain = chain
+
+    def __getitem__(self, block) -> Block:
+        return Block(self.chain, block)
+
+
+class Shell:
+
+    def __init__(self, chain: Chain):
+        self.blocks = Blocks(chain)
+
+
+class Contract:
+    # the oracle as seen through pytezos' contract(): real calls, read through the stand-in shell
+
+    def __init__(self, chain: Chain):
+        self.address: str = oracle_address
+        self.shell = Shell(chain)
+        self.interface = chain.interface
+        self.program = chain.interface.program
+
+    def update(self, data: dict) -> Call:
+        return Call(self.interface.update(data), lambda storage: [data["request_id"]])
+
+    def get_price(self, params: dict) -> Call:
+        return Call(self.interface.get_price(params), lambda storage: [storage["counter"]], REQUEST_PRICE)
+
+
+class Node:
+    # pytezos client bound to the chain, the feeder's `pytezos.using(...)` lands here
+
+    def __init__(self, chain: Chain):
+        self.chain = chain
+        self.key = SimpleNamespace(public_key_hash=lambda: feeder_address)
+        self.shell = Shell(chain)
+
+    def using(self, **kwargs):
+        return self
+
+    def contract(self, address: str) -> Contract:
+        return Contract(self.chain)
+
+    def account(self) -> dict:
+        return self.chain.rpc("counter", {"counter": str(self.chain.counters.get(feeder_address, 0))})
+
+    def bulk(self, *calls) -> Group:
+        return Group(self.chain, feeder_address, calls)
+
+
+class Web:
+    # every http call of the feeder: head stream, indexer and tickers, with latency and errors on the exchanges
+
+    def __init__(self, chain: Chain, pairs: list, ticker_latency: float = 0, ticker_errors: float = 0,
+                 indexer_latency: float = 0, indexer_lag: int = 1, seed: int = 0):
+        self.chain = chain
+        self.pairs: list = pairs
+        self.ticker_latency: float = ticker_latency
+        self.ticker_errors: float = ticker_errors
+        self.indexer_latency: float = indexer_latency
+        self.indexer_lag: int = indexer_lag
+        self.random = Random(seed)
+        self.calls: Counter = Counter()  # host -> calls
+
+    def request(self, method: str, url: str, params: dict = None, **kwargs) -> Response:
+        host: str = urlsplit(url).netloc
+        self.calls[host] += 1
+        if url.startswith(node):
+            if url.endswith("/monitor/heads/main"):
+                return Response(lines=self.chain.heads())
+            return Response(body=self.chain.head())
+        if url.startswith(tzkt):
+            sleep(self.indexer_latency)
+            return Response(body=self.chain.keys(params, self.indexer_lag))
+        if self.ticker_latency:
+            sleep(self.random.expovariate(1 / self.ticker_latency))
+        if self.random.random() < self.ticker_errors:
+            return Response(503)
+        if url.startswith(binance):
+            if url.endswith("/exchangeInfo"):
+                return Response(body={"symbols": [{"symbol": pair, "status": "TRADING"} for pair in self.pairs]})
+            if any(pair not in self.pairs for pair in loads(params["symbols"])):
+                return Response(400, body={"code": -1121, "msg": "Invalid symbol."})
+            return Response(body=[self.ticker(pair) for pair in loads(params["symbols"])])
+        return Response(body={"time": int(time() * 1000), "ticker": [{
+            "symbol": f"{pair[:3]}-{pair[3:]}", "last": "12.5", "low": "12", "high": "13", "vol": "1500",
+            "volValue": "18750"
+        } for pair in self.pairs]})
+
+    @staticmethod
+    def ticker(pair: str) -> dict:
+        now: int = int(time() * 1000)
+        return {"symbol": pair, "openTime": now - 86_400_000, "closeTime": now, "lastPrice": "12.50000000",
+                "lowPrice": "12.00000000", "highPrice": "13.00000000", "volume": "1500.00000000",
+                "quoteVolume": "18750.00000000"}
+
+
+def load(chain: Chain, contract: Contract, rate: float, mix: dict, stop: Event, seed: int = 0):
+    # poisson arrivals of get_price calls, pairs drawn with the mix weights
+    rng = Random(seed)
+    pairs: list = list(mix)
+    while not stop.wait(rng.expovariate(rate)):
+        pair: str = rng.choices(pairs, weights=[mix[pair] for pair in pairs])[0]
+        call: Call = contract.get_price({"pair": pair, "target": f"{client_address}%receive_price",
+                                         "target_address": client_address, "target_entrypoint": "receive_price"})
+        chain.submit(Group(chain, rng.choice(users), [call]))
+
+
+def percentiles(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{q}": values[min(len(values) - 1, int(q / 100 * len(values)))] for q in (50, 95, 99)}
+
+
+def report(chain: Chain, web: Web, loaded: int) -> dict:
+    served: list = [(chain.created[request_id], at) for request_id, at in chain.served.items()]
+    requests: int = max(len(served), 1)
+    node_calls: int = sum(chain.calls.values()) + web.calls[urlsplit(node).netloc]
+    return {
+        "blocks": chain.level,
+        "requests": len(chain.requests),
+        "inline": chain.inline,
+        "served": len(served),
+        "pending": len(chain.requests) - chain.inline - len(served),
+        "failed_groups": chain.failed,
+        "served_per_block": {"mean": sum(chain.updates[:loaded]) / max(loaded, 1), "max": max(chain.updates)},
+        "latency_blocks": percentiles([at[0] - created[0] for created, at in served]),
+        "latency_seconds": percentiles([round(at[1] - created[1], 3) for created, at in served]),
+        "rpc_per_request": round(node_calls / requests, 2),
+        "indexer_per_request": round(web.calls[urlsplit(tzkt).netloc] / requests, 2),
+        "exchange_per_request": round((web.calls[urlsplit(binance).netloc] + web.calls[urlsplit(kucoin).netloc])
+                                      / requests, 2),
+        "rpc": dict(chain.calls)
+    }
+
+
+def bench(contract_path: str = compiled_contract_path, blocks: int = 20, block_time: float = 1.0, rate: float = 5.0,
+          mix: dict = None, ticker_latency: float = 0.05, ticker_errors: float = 0.0, indexer_latency: float = 0.01,
+          indexer_lag: int = 1, node_latency: float = 0.0, quorum: int = 1, seed: int = 0,
+          verbose: bool = False) -> dict:
+    # runs data_feed.feed against the stand-ins for the given blocks of load, then drains the backlog
+    mix = mix or {"BTCUSDT": 1}
+    chain = Chain(load_oracle(contract_path), list(mix), node_latency=node_latency)
+    web = Web(chain, list(mix), ticker_latency, ticker_errors, indexer_latency, indexer_lag, seed)
+    stop = Event()
+    with TemporaryDirectory() as tmp, open(devnull, "w") as quiet, \
+            patch.object(pool, "request", web.request), \
+            patch.multiple(data_feed, pytezos=Node(chain), shell=node, oracle_address=oracle_address, id=big_map_id,
+                           sources=[Binance(binance), KuCoin(kucoin)]):
+        with redirect_stdout(sys.stdout if verbose else quiet):
+            Thread(target=data_feed.feed, args=("",), daemon=True,
+                   kwargs={"checkpoint_path": join(tmp, "feeder.sqlite"), "quorum": quorum, "metrics_port": 0}).start()
+            Thread(target=load, args=(chain, Contract(chain), rate, mix, stop, seed), daemon=True).start()
+            for _ in range(blocks):
+                sleep(block_time)
+                chain.bake()
+            stop.set()
+            for _ in range(DRAIN):
+                sleep(block_time)
+                chain.bake()
+                if len(chain.served) + chain.inline == len(chain.requests):
+                    break
+            chain.wait_idle(timeout=10 * block_time)
+    return report(chain, web, blocks)
+
+
+def main():
+    parser = ArgumentParser(description="Offline load test of the data feeder")
+    parser.add_argument("--contract", default=compiled_contract_path, help="compiled oracle, see make compile")
+    parser.add_argument("--blocks", type=int, default=20, help="blocks baked while the load runs")
+    parser.add_argument("--block-time", type=float, default=1.0, help="seconds between two blocks")
+    parser.add_argument("--rate", type=float, default=5.0, help="get_price calls per second")
+    parser.add_argument("--pairs", default="BTCUSDT=1", help="pair mix, pair=weight separated by commas")
+    parser.add_argument("--ticker-latency", type=float, default=0.05, help="mean exchange latency in seconds")
+    parser.add_argument("--ticker-errors", type=float, default=0.0, help="share of exchange calls failing")
+    parser.add_argument("--indexer-latency", type=float, default=0.01, help="indexer latency in seconds")
+    parser.add_argument("--indexer-lag", type=int, default=1, help="blocks the indexer lags behind the node")
+    parser.add_argument("--node-latency", type=float, default=0.0, help="node rpc latency in seconds")
+    parser.add_argument("--quorum", type=int, default=1, help="quote sources to wait for")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep the feeder output")
+    args = parser.parse_args()
+    mix: dict = {pair: float(weight) for pair, weight in (item.split("=") for item in args.pairs.split(","))}
+    print(dumps(bench(args.contract, args.blocks, args.block_time, args.rate, mix, args.ticker_latency,
+                      args.ticker_errors, args.indexer_latency, args.indexer_lag, args.node_latency, args.quorum,
+                      args.seed, args.verbose), indent=2))
+
+
+if __name__ == "__main__":
+    main()
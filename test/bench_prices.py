@@ -0,0 +1,62 @@
+import json
+import sys
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+from random import Random
+from timeit import timeit
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))  # run as a script from this test folder too
+from feeder.prices import loads, to_quote
+
+# decoding and scaling of a multi-pair ticker payload, the float path the feeder used before against the exact one:
+#   python bench_prices.py --pairs 500
+
+
+def float_quote(res: dict) -> dict:
+    return {
+        "pair": res["symbol"],
+        "open_time": int(int(res["openTime"]) / 1000),
+        "close_time": int(int(res["closeTime"]) / 1000),
+        "last_price": int(float(res["lastPrice"]) * 10 ** 8),
+        "low_price": int(float(res["lowPrice"]) * 10 ** 8),
+        "high_price": int(float(res["highPrice"]) * 10 ** 8),
+        "volume": int(float(res["volume"]) * 10 ** 8),
+        "quote_volume": int(float(res["quoteVolume"]) * 10 ** 8)
+    }
+
+
+def payload(pairs: int, seed: int = 0) -> bytes:
+    # binance 24h tickers with prices from 1e-8 to 1e5 and volumes up to 1e12, 8 decimals like the exchange
+    rng = Random(seed)
+
+    def decimal(scale: float) -> str:
+        return f"{rng.uniform(0, scale):.8f}"
+
+    return json.dumps([{
+        "symbol": f"P{i:04d}USDT", "openTime": 1_650_000_000_000, "closeTime": 1_650_086_400_000,
+        "lastPrice": decimal(10 ** rng.randint(-4, 5)), "lowPrice": decimal(10 ** rng.randint(-4, 5)),
+        "highPrice": decimal(10 ** rng.randint(-4, 5)), "volume": decimal(10 ** rng.randint(0, 12)),
+        "quoteVolume": decimal(10 ** rng.randint(0, 12))
+    } for i in range(pairs)]).encode()
+
+
+def main():
+    parser = ArgumentParser(description="Micro-benchmark of the ticker normalization")
+    parser.add_argument("--pairs", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    body: bytes = payload(args.pairs)
+    before = timeit(lambda: [float_quote(ticker) for ticker in json.loads(body)], number=args.runs) / args.runs
+    after = timeit(lambda: [to_quote(ticker) for ticker in loads(body)], number=args.runs) / args.runs
+    inexact: int = sum(
+        float_quote(ticker)[field] != to_quote(ticker)[field]
+        for ticker in json.loads(body) for field in ("last_price", "low_price", "high_price", "volume", "quote_volume")
+    )
+    print(f"{args.pairs} pairs, decoder {loads.__module__}")
+    print(f"float path  {before * 1e6 / args.pairs:8.2f} us per pair")
+    print(f"exact path  {after * 1e6 / args.pairs:8.2f} us per pair")
+    print(f"{inexact} of {5 * args.pairs} float scaled fields off by float rounding")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from os.path import abspath, dirname
+
+# the feeder lives at the repository root, next to this test folder
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
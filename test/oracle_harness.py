@@ -0,0 +1,257 @@
+from argparse import ArgumentParser
+from hashlib import sha256
+from json import dump, load
+from os import makedirs, replace
+from os.path import abspath, exists, join
+from random import Random
+from tempfile import NamedTemporaryFile, gettempdir
+from time import perf_counter
+from types import MappingProxyType
+
+from pytezos import ContractInterface, MichelsonRuntimeError
+from pytezos.context.impl import ExecutionContext
+from pytezos.michelson.parse import michelson_to_micheline
+from pytezos.michelson.program import MichelsonProgram
+from pytezos.michelson.stack import MichelsonStack
+
+# shared by the contract tests, the feeder bench and the cost profile:
+#   load_oracle      the compiled contract parsed once per process, its micheline cached on disk by file hash
+#   StorageTemplate  immutable storage handing out fresh copies, no deepcopy per test
+#   Runner           interpret() without matching the whole script again on every call
+#   replay           get_price / update sequences on one storage, checked against OracleModel
+#   python oracle_harness.py --steps 5000 --seed 7    long fuzz run
+
+compiled_contract_path = "Oracle.tz"
+CACHE = join(gettempdir(), "oracle-tests")  # parsed contracts by file hash, shared by the worker processes
+
+entrypoint_doesnt_exist = "Entrypoint doesn't exist"
+amount_must_be_oracle_price = "Invalid amount to create a request"
+pair_not_supported = "This pair isn't supported"
+request_already_exists = "Request already exists"
+request_not_found = "Request not found"
+not_whitelisted = "User isn't whitelisted"
+
+admin = 'tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK'
+alice = 'tz1hNVs94TTjZh6BZ1PM5HL83A7aiZXkQ8ur'
+bob = 'tz1c6PPijJnZYjKiSQND4pMtGMg6csGeAiiF'
+oscar = 'tz1Phy92c2n817D17dUGzxNgw1qCkNSTWZY2'
+contract_address = "KT1BEqzn5Wx8uJrZNvuS9DVHmLvG9td3fDLi"
+receive = "receive"
+
+REQUEST_PRICE: int = 1000
+STEPS: int = 300  # replayed steps per seed in the test suite
+
+oracles: dict = {}  # file hash -> parsed contract, per process
+
+
+def load_oracle(path: str = compiled_contract_path) -> ContractInterface:
+    with open(path, "rb") as f:
+        source: bytes = f.read()
+    digest: str = sha256(source).hexdigest()
+    if digest not in oracles:
+        cached: str = join(CACHE, f"{digest}.json")
+        if exists(cached):
+            with open(cached) as f:
+                micheline = load(f)
+        else:
+            micheline = michelson_to_micheline(source.decode())
+            makedirs(CACHE, exist_ok=True)
+            with NamedTemporaryFile("w", dir=CACHE, suffix=".tmp", delete=False) as f:
+                dump(micheline, f)
+            replace(f.name, cached)  # atomic, concurrent workers never read a partial file
+        oracles[digest] = ContractInterface.from_micheline(micheline)
+    return oracles[digest]
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, set, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class StorageTemplate:
+    # read-only storage, every call returns a fresh mutable copy with the given fields replaced
+
+    def __init__(self, fields: dict):
+        self.fields = freeze(fields)
+
+    def __call__(self, **overrides) -> dict:
+        return {**thaw(self.fields), **overrides}
+
+    def __getitem__(self, field: str):
+        return thaw(self.fields[field])
+
+
+class Runner:
+    # the oracle program matched once, pytezos' interpret() matches the script twice per call
+
+    def __init__(self, oracle: ContractInterface):
+        self.oracle: ContractInterface = oracle
+        self.program = MichelsonProgram.load(ExecutionContext(script=oracle.context.script), with_code=True)
+
+    def interpret(self, entrypoint: str, argument, storage: dict, sender: str = None, amount: int = None,
+                  now: int = None) -> tuple:
+        # returns the storage and the operations, raises MichelsonRuntimeError like interpret()
+        parameters: dict = getattr(self.oracle, entrypoint)(argument).parameters
+        context = ExecutionContext(amount=amount, sender=sender, source=sender, now=now,
+                                   script=self.oracle.context.script)
+        stack, stdout = MichelsonStack(), []
+        res = self.program.instantiate(
+            entrypoint=parameters["entrypoint"],
+            parameter=parameters["value"],
+            storage=self.program.storage.from_python_object(storage).to_micheline_value(lazy_diff=True)
+        )
+        res.begin(stack, stdout, context)
+        res.execute(stack, stdout, context)
+        operations, result, lazy_diff, _ = res.end(stack, stdout)
+        storage = self.program.storage.from_micheline_value(result).merge_lazy_diff(lazy_diff)
+        return storage.to_python_object(lazy_diff=True), operations
+
+
+def failwith(error: MichelsonRuntimeError) -> str:
+    # the FAILWITH string of an interpreter error, or its first line for the other errors
+    message: str = error.format_stdout()
+    if message.startswith("FAILWITH: '"):
+        return message[len("FAILWITH: '"):-1]
+    return message.split("'")[1] if message.startswith("'") else message.splitlines()[0]
+
+
+def get_price_params(pair: str) -> dict:
+    return {"pair": pair, "target": f"{contract_address}%{receive}", "target_address": contract_address,
+            "target_entrypoint": receive}
+
+
+def update_params(pair: str, request_id: int, last_price: int = 1_000) -> dict:
+    return {"pair": pair, "open_time": 0, "close_time": 100, "last_price": last_price, "low_price": 5,
+            "high_price": 10_000, "volume": 500, "quote_volume": 100_000, "request_id": request_id,
+            "target": f"{contract_address}%{receive}"}
+
+
+class OracleModel:
+    # get_price and update as written in partials/methods.mligo, on a plain python storage
+
+    def __init__(self, storage: dict):
+        self.storage: dict = storage
+
+    def get_price(self, params: dict, sender: str, amount: int, now: int) -> str:
+        storage: dict = self.storage
+        if amount != storage["request_price"]:
+            return amount_must_be_oracle_price
+        if params["pair"] not in storage["supported_pairs"]:
+            return pair_not_supported
+        price: dict = storage["prices"].get(params["pair"])
+        should_update: bool = price is None or not price["update_time"] >= now
+        if storage["counter"] in storage["requests"]:
+            return request_already_exists
+        storage["requests"][storage["counter"]] = {"pair": params["pair"], "status": not should_update,
+                                                   "target_address": params["target_address"],
+                                                   "target_entrypoint": params["target_entrypoint"]}
+        storage["counter"] += 1
+
+    def update(self, params: dict, sender: str, amount: int, now: int) -> str:
+        storage: dict = self.storage
+        if sender not in storage["whitelist"]:
+            return not_whitelisted
+        if params["pair"] not in storage["supported_pairs"]:
+            return pair_not_supported
+        if params["request_id"] not in storage["requests"]:
+            return request_not_found
+        storage["prices"][params["pair"]] = {
+            "pair": params["pair"], "update_time": now,
+            **{field: params[field] for field in ("open_time", "close_time", "last_price", "low_price",
+                                                  "high_price", "volume", "quote_volume")}
+        }
+        storage["requests"][params["request_id"]]["status"] = True
+
+
+def replay(oracle: ContractInterface, storage: dict, steps: list) -> tuple:
+    # runs (entrypoint, argument, sender, amount, now) steps one after the other, returns the error of
+    # every step (None when applied) and the final storage; only the request a step reads goes through
+    # the interpreter so the cost of a step doesn't grow with the replay
+    runner = Runner(oracle)
+    storage = dict(storage)
+    requests: dict = dict(storage.pop("requests"))
+    errors: list = []
+    for entrypoint, argument, sender, amount, now in steps:
+        key: int = storage["counter"] if entrypoint == "get_price" else argument["request_id"]
+        try:
+            storage, _ = runner.interpret(entrypoint, argument,
+                                          {**storage, "requests": {key: requests[key]} if key in requests else {}},
+                                          sender=sender, amount=amount, now=now)
+        except MichelsonRuntimeError as e:
+            errors.append(failwith(e))
+            continue
+        requests.update(storage.pop("requests"))
+        errors.append(None)
+    return errors, {**storage, "requests": requests}
+
+
+def random_steps(rng: Random, count: int, pairs: list, whitelist: list) -> list:
+    # mostly valid traffic with unsupported pairs, wrong amounts, unknown requests and outsiders mixed in
+    steps: list = []
+    now: int = 0
+    requests: int = 0
+    for _ in range(count):
+        now += rng.choice([0, 0, 1, 30, 120])
+        if rng.random() < 0.5:
+            pair: str = rng.choice(pairs + ["XTZBTC"])
+            amount: int = REQUEST_PRICE if rng.random() < 0.9 else rng.choice([0, REQUEST_PRICE - 1])
+            steps.append(("get_price", get_price_params(pair), alice, amount, now))
+            requests += 1
+        else:
+            sender: str = rng.choice(whitelist) if rng.random() < 0.9 else oscar
+            pair = rng.choice(pairs + ["XTZBTC"]) if rng.random() < 0.1 else rng.choice(pairs)
+            request_id: int = rng.randrange(requests + 2)
+            steps.append(("update", update_params(pair, request_id, rng.randrange(1, 10 ** 12)), sender, 0, now))
+    return steps
+
+
+def fuzz(oracle: ContractInterface, storage: dict, seed: int, count: int = STEPS) -> list:
+    # replays random steps on the contract and on the model, returns the steps where they disagree
+    rng = Random(seed)
+    steps: list = random_steps(rng, count, list(storage["supported_pairs"]), list(storage["whitelist"]))
+    errors, final = replay(oracle, storage, steps)
+    model = OracleModel({**storage, "prices": dict(storage["prices"]),
+                         "requests": {key: dict(request) for key, request in storage["requests"].items()}})
+    mismatches: list = []
+    for i, (step, error) in enumerate(zip(steps, errors)):
+        expected: str = getattr(model, step[0])(*step[1:])
+        if expected != error:
+            mismatches.append(f"step {i} {step[0]}: contract {error!r}, model {expected!r}")
+    for field in ("counter", "prices", "requests"):
+        if final[field] != model.storage[field]:
+            mismatches.append(f"final {field} differ")
+    return mismatches
+
+
+def main():
+    parser = ArgumentParser(description="Replay random get_price / update sequences against the oracle")
+    parser.add_argument("--contract", default=compiled_contract_path)
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    oracle = load_oracle(abspath(args.contract))
+    storage: dict = {**oracle.storage.dummy(), "admin": admin, "counter": 0, "request_price": REQUEST_PRICE,
+                     "supported_pairs": ["BTCETH", "XTZUSDT"], "whitelist": [admin, bob], "prices": {},
+                     "requests": {}}
+    start: float = perf_counter()
+    mismatches: list = fuzz(oracle, storage, args.seed, args.steps)
+    print(f"{args.steps} steps in {perf_counter() - start:.1f}s, {len(mismatches)} mismatches")
+    for mismatch in mismatches:
+        print(mismatch)
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
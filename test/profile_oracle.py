@@ -0,0 +1,187 @@
+from argparse import ArgumentParser
+from json import dump, load
+from os.path import abspath, dirname, join
+from time import perf_counter
+
+from pytezos.crypto.encoding import base58_encode
+from pytezos.michelson.forge import forge_micheline
+from pytezos.michelson.repl import Interpreter
+from pytezos.operation.forge import forge_operation
+
+from oracle_harness import load_oracle
+
+# cost curves of every oracle entrypoint over storages of 1 to 1000 pairs and whitelisted users:
+#   python profile_oracle.py           compares against the baseline
+#   python profile_oracle.py --save    records a new baseline after a deliberate contract change
+# the interpreter has no gas metering, the curves use the cost drivers it can measure instead:
+#   instructions     michelson instructions executed
+#   storage_bytes    binary size of the storage without its big_map, deserialized on every call
+#   paid_storage     storage growth plus the new big_map entries, what the caller pays for
+#   operation_bytes  binary size of the transaction, what the fees are computed on
+
+compiled_contract_path = "Oracle.tz"
+BASELINE = join(dirname(abspath(__file__)), "oracle_costs.json")
+
+admin = 'tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK'
+alice = 'tz1hNVs94TTjZh6BZ1PM5HL83A7aiZXkQ8ur'
+oracle_address = "KT1HJmhtdDw88kCEEiyaw6iYwzPsTphxzzRz"
+contract_address = "KT1BEqzn5Wx8uJrZNvuS9DVHmLvG9td3fDLi"
+
+SIZES: tuple = (1, 10, 100, 1000)  # pairs, and users in the whitelist
+GATED: tuple = ("instructions", "storage_bytes", "paid_storage", "operation_bytes")
+THRESHOLD: float = 0.05  # relative increase of a gated cost that fails the suite
+NOW: int = 1_650_000_000
+REQUEST_PRICE: int = 1000
+
+
+def pair_name(i: int) -> str:
+    return f"P{i:04d}USDT"
+
+
+def user_address(i: int) -> str:
+    return base58_encode(i.to_bytes(20, "big"), b"tz1").decode()
+
+
+def price(pair: str, update_time: int) -> dict:
+    return {"pair": pair, "update_time": update_time, "open_time": NOW - 86_400, "close_time": NOW,
+            "last_price": 1_250_000_000, "low_price": 1_200_000_000, "high_price": 1_300_000_000,
+            "volume": 150_000_000_000, "quote_volume": 1_875_000_000_000}
+
+
+def request(pair: str) -> dict:
+    return {"pair": pair, "status": False, "target_address": contract_address, "target_entrypoint": "receive"}
+
+
+def storage_for(size: int, update_time: int = 0) -> dict:
+    pairs: list = [pair_name(i) for i in range(size)]
+    return {
+        "admin": admin,
+        "counter": 1,
+        "prices": {pair: price(pair, update_time) for pair in pairs},
+        "requests": {0: request(pairs[0])},
+        "request_price": REQUEST_PRICE,
+        "supported_pairs": pairs,
+        "whitelist": [admin] + [user_address(i) for i in range(1, size)]
+    }
+
+
+def scenarios(size: int) -> dict:
+    # name -> (entrypoint, argument, sender, amount, update time of the stored prices)
+    pair: str = pair_name(0)
+    get_price: dict = {"pair": pair, "target": f"{contract_address}%receive", "target_address": contract_address,
+                       "target_entrypoint": "receive"}
+    quote: dict = {field: value for field, value in price(pair, 0).items() if field != "update_time"}
+    return {
+        "get_price": ("get_price", get_price, alice, REQUEST_PRICE, 0),
+        "get_price/inline": ("get_price", get_price, alice, REQUEST_PRICE, NOW),
+        "update": ("update", {**quote, "request_id": 0, "target": f"{contract_address}%receive"}, admin, 0, 0),
+        "whitelist_user": ("whitelist_user", user_address(size + 1), admin, 0, 0),
+        "blacklist_user": ("blacklist_user", user_address(size - 1) if size > 1 else admin, admin, 0, 0),
+        "whitelist_pair": ("whitelist_pair", "NEWPAIR", admin, 0, 0),
+        "blacklist_pair": ("blacklist_pair", pair, admin, 0, 0),
+        "change_request_price": ("change_request_price", 2 * REQUEST_PRICE, admin, 0, 0),
+        "set_admin": ("set_admin", alice, admin, 0, 0),
+        "harvest_xtz": ("harvest_xtz", admin, admin, 0, 0),
+    }
+
+
+def measure(oracle, storage: dict, entrypoint: str, argument, sender: str, amount: int) -> dict:
+    call = getattr(oracle, entrypoint)(argument)
+    start: float = perf_counter()
+    _, result, lazy_diff, stdout, error = Interpreter.run_code(
+        parameter=call.parameters["value"],
+        entrypoint=call.parameters["entrypoint"],
+        storage=oracle.program.storage.from_python_object(storage).to_micheline_value(lazy_diff=True),
+        script=oracle.context.script["code"],
+        sender=sender,
+        source=sender,
+        amount=amount,
+        now=NOW
+    )
+    seconds: float = perf_counter() - start
+    if error:
+        raise error
+    before: int = len(forge_micheline(
+        oracle.program.storage.from_python_object({**storage, "requests": 0}).to_micheline_value()))
+    known: set = {forge_micheline({"int": str(key)}) for key in storage["requests"]}
+    new_entries: int = sum(
+        len(forge_micheline(update["key"])) + len(forge_micheline(update["value"]))
+        for diff in lazy_diff for update in diff["diff"].get("updates", [])
+        if "value" in update and forge_micheline(update["key"]) not in known
+    )
+    after: int = len(forge_micheline(result))
+    return {
+        "instructions": len([line for line in stdout if not line.startswith(("BEGIN", "END"))]),
+        "storage_bytes": before,
+        "paid_storage": max(0, after - before) + new_entries,
+        "operation_bytes": len(forge_operation({
+            "kind": "transaction", "source": sender, "fee": "0", "counter": "1", "gas_limit": "0",
+            "storage_limit": "0", "amount": str(amount), "destination": oracle_address,
+            "parameters": call.parameters
+        })),
+        "seconds": round(seconds, 4)
+    }
+
+
+def profile(contract_path: str = compiled_contract_path, sizes: tuple = SIZES) -> dict:
+    # scenario -> size -> costs, for every scenario whose entrypoint the contract has
+    oracle = load_oracle(contract_path)
+    costs: dict = {}
+    for size in sizes:
+        for name, (entrypoint, argument, sender, amount, update_time) in scenarios(size).items():
+            if entrypoint not in oracle.entrypoints:
+                continue
+            costs.setdefault(name, {})[str(size)] = measure(oracle, storage_for(size, update_time), entrypoint,
+                                                            argument, sender, amount)
+    return costs
+
+
+def compare(costs: dict, baseline: dict, threshold: float = THRESHOLD) -> list:
+    # every gated cost above the baseline by more than the threshold, scenarios or sizes new to it are skipped
+    regressions: list = []
+    for name, curve in sorted(costs.items()):
+        for size, measured in curve.items():
+            expected: dict = baseline.get(name, {}).get(size)
+            if expected is None:
+                continue
+            for metric in GATED:
+                if measured[metric] > expected[metric] * (1 + threshold):
+                    regressions.append(f"{name} with {size} pairs: {metric} {expected[metric]} -> {measured[metric]}")
+    return regressions
+
+
+def print_curves(costs: dict):
+    print(f"{'scenario':<22}{'pairs':>6}" + "".join(f"{metric:>17}" for metric in GATED) + f"{'ms':>9}")
+    for name, curve in sorted(costs.items()):
+        for size, measured in curve.items():
+            print(f"{name:<22}{size:>6}" + "".join(f"{measured[metric]:>17}" for metric in GATED)
+                  + f"{measured['seconds'] * 1000:>9.1f}")
+        first, last = curve[min(curve, key=int)], curve[max(curve, key=int)]
+        pairs: int = max(int(size) for size in curve) - min(int(size) for size in curve)
+        if pairs:
+            print(f"{'':<22}{'':>6}" + "".join(f"{(last[m] - first[m]) / pairs:>13.2f}/pair" for m in GATED))
+
+
+def main():
+    parser = ArgumentParser(description="Cost curves of the oracle entrypoints")
+    parser.add_argument("--contract", default=compiled_contract_path, help="compiled oracle, see make compile")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--save", action="store_true", help="record the curves as the new baseline")
+    args = parser.parse_args()
+    costs: dict = profile(args.contract)
+    print_curves(costs)
+    if args.save:
+        with open(args.baseline, "w") as f:
+            dump(costs, f, indent=2, sort_keys=True)
+        return
+    with open(args.baseline) as f:
+        regressions: list = compare(costs, load(f), args.threshold)
+    for regression in regressions:
+        print(regression)
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+from unittest import TestCase
+
+from bench_feeder import bench
+
+# short offline runs of the feeder against the stand-ins, the thresholds catch throughput regressions
+BLOCK_TIME = 0.5
+
+
+class FeederBenchTest(TestCase):
+
+    def test_feeder_serves_every_request_within_a_few_blocks(self):
+        report = bench(blocks=6, block_time=BLOCK_TIME, rate=20, mix={"BTCUSDT": 3, "XTZUSDT": 1})
+        self.assertGreater(report["served"], 0)
+        self.assertEqual(0, report["pending"])
+        self.assertEqual(0, report["failed_groups"])
+        self.assertLessEqual(report["latency_blocks"]["p95"], 3)
+        self.assertLessEqual(report["rpc_per_request"], 3)
+        self.assertLessEqual(report["indexer_per_request"], 1)
+
+    def test_feeder_serves_through_exchange_errors_and_indexer_lag(self):
+        report = bench(blocks=6, block_time=BLOCK_TIME, rate=10, mix={"BTCUSDT": 1, "ETHUSDT": 1},
+                       ticker_errors=0.3, indexer_lag=2, seed=1)
+        self.assertEqual(0, report["pending"])
+        self.assertLessEqual(report["latency_blocks"]["p95"], 4)
@@ -0,0 +1,962 @@
+import asyncio
+from json import dumps, loads
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Barrier, Event, Thread
+from time import monotonic, sleep
+from unittest import TestCase, skipIf
+from unittest.mock import MagicMock, patch
+from urllib.request import urlopen
+
+from pytezos import ContractInterface
+from pytezos.rpc.node import RpcError
+
+import data_feed
+from feeder.heads import watch_heads
+from feeder.cache import PriceCache
+from feeder.checkpoint import Checkpoint
+from feeder.injector import Injector
+from feeder.metrics import Metrics, Tracer
+from feeder.preflight import preflight
+from feeder.prices import Quote, fetch_tickers, scale, to_quote
+from feeder.scanner import PendingRequests
+from feeder.scheduler import RefreshScheduler
+from feeder.sessions import HttpPool
+from feeder.shards import Leases
+from feeder.snapshot import StorageSnapshot
+from feeder.sources import Binance, HedgedQuotes, KuCoin
+from feeder.stream import TickerStream, websockets
+
+big_map_id = 84085
+admin_address = "tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK"
+
+# same storage field names and update checks as the oracle, with prices reduced to a timestamp
+storage_code = """
+parameter (or (pair %update (string %pair) (nat %request_id)) (unit %noop));
+storage (pair (pair (address %admin) (nat %counter))
+              (pair (map %prices string timestamp)
+                    (pair (big_map %requests nat (pair (string %pair)
+                                                       (pair (bool %status)
+                                                             (pair (address %target_address)
+                                                                   (string %target_entrypoint)))))
+                          (pair (set %supported_pairs string) (set %whitelist address)))));
+code { UNPAIR;
+       IF_LEFT
+         { DUP 2; GET 8; SENDER; MEM; IF {} { PUSH string "User isn't whitelisted"; FAILWITH };
+           DUP 2; GET 7; DUP 2; CAR; MEM; IF {} { PUSH string "This pair isn't supported"; FAILWITH };
+           DUP 2; GET 5; DUP 2; CDR; MEM; IF {} { PUSH string "Request not found"; FAILWITH };
+           DROP }
+         { DROP };
+       NIL operation; PAIR };
+"""
+storage_expr = {"prim": "Pair", "args": [
+    {"prim": "Pair", "args": [{"string": "tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK"}, {"int": "3"}]},
+    {"prim": "Pair", "args": [
+        [{"prim": "Elt", "args": [{"string": "BTCETH"}, {"int": "12"}]}],
+        {"prim": "Pair", "args": [
+            {"int": str(big_map_id)},
+            {"prim": "Pair", "args": [[{"string": "BTCETH"}], [{"string": "tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK"}]]}
+        ]}
+    ]}
+]}
+
+
+def pending_request(pair: str = "BTCETH") -> dict:
+    return {
+        "pair": pair,
+        "status": False,
+        "target_address": "KT1BEqzn5Wx8uJrZNvuS9DVHmLvG9td3fDLi",
+        "target_entrypoint": "receive"
+    }
+
+
+def ticker(symbol: str) -> dict:
+    return {
+        "symbol": symbol,
+        "openTime": 1_650_000_000_000,
+        "closeTime": 1_650_086_400_000,
+        "lastPrice": "12.50000000",
+        "lowPrice": "12.00000000",
+        "highPrice": "13.00000000",
+        "volume": "1500.00000000",
+        "quoteVolume": "18750.00000000"
+    }
+
+
+def applied(status: str = "applied") -> dict:
+    return {"kind": "transaction", "metadata": {"operation_result": {"status": status}}}
+
+
+def fake_chain(blocks: dict):
+    # admin client whose groups get sequential hashes and whose blocks hold the given manager operations
+    admin = MagicMock()
+    admin.account.return_value = {"counter": "40"}
+    groups = []
+
+    def autofill(ttl, **limits):
+        gas_limit = limits.get("gas_limit", 1500 * len(admin.bulk.call_args.args)) // len(admin.bulk.call_args.args)
+        group = MagicMock(contents=[{"counter": "0", "gas_limit": str(gas_limit), "storage_limit": "100"}
+                                    for _ in admin.bulk.call_args.args])
+        group.sign.return_value.hash.return_value = f"oo{len(groups)}"
+        groups.append(group)
+        return group
+
+    autofill.groups = groups
+    admin.bulk.return_value.autofill.side_effect = autofill
+    admin.bulk.return_value.fill.side_effect = autofill
+
+    class Blocks:
+        levels = {}
+
+        def __getitem__(self, block):
+            if isinstance(block, int):
+                return MagicMock(hash=MagicMock(return_value=self.levels.get(block, f"BL{block}")))
+            return MagicMock(operations=MagicMock(managers=MagicMock(return_value=blocks[block])))
+
+    admin.shell.blocks = Blocks()
+    return admin
+
+
+def unreachable_chain(error: Exception):
+    # fake_chain whose injections fail with the given error
+    admin = fake_chain({})
+    autofill = admin.bulk.return_value.autofill.side_effect
+
+    def unreachable(ttl, **limits):
+        group = autofill(ttl, **limits)
+        group.sign.return_value.inject.side_effect = error
+        return group
+
+    admin.bulk.return_value.autofill.side_effect = unreachable
+    return admin
+
+
+class FakeSource:
+    # quotes every asked pair, and the extra pairs, at the given last price
+
+    def __init__(self, name: str, last_price: int, delay: float = 0, error: bool = False, pairs: list = (),
+                 listed: set = None):
+        self.name = name
+        self.listed = listed  # pairs the exchange lists, every pair by default
+        self.last_price = last_price
+        self.delay = delay
+        self.error = error
+        self.pairs = list(pairs)
+        self.calls = 0
+
+    def fetch(self, pairs: list, timeout: float) -> dict:
+        self.calls += 1
+        sleep(self.delay)
+        if self.error:
+            raise ConnectionError("exchange down")
+        return {pair: Quote(pair, 0, 100, self.last_price, self.last_price, self.last_price, 500, 100_000)
+                for pair in pairs + self.pairs if self.listed is None or pair in self.listed}
+
+
+def ticker_event(symbol: str, last_price: str) -> dict:
+    # combined stream message of the binance 24h ticker
+    return {"stream": f"{symbol.lower()}@ticker", "data": {
+        "e": "24hrTicker", "s": symbol, "O": 1_650_000_000_000, "C": 1_650_086_400_000, "c": last_price,
+        "l": last_price, "h": last_price, "v": "1500.00000000", "q": "18750.00000000"
+    }}
+
+
+def stand_in_exchange(messages: list) -> tuple:
+    # local websocket server pushing the given messages to every client, returns its url and the paths asked
+    loop = asyncio.new_event_loop()
+    paths = []
+
+    async def handler(connection):
+        paths.append(connection.request.path)
+        for message in messages:
+            await connection.send(dumps(message))
+        await connection.wait_closed()
+
+    async def serve():
+        return await websockets.serve(handler, "127.0.0.1", 0)
+
+    server = loop.run_until_complete(serve())
+    Thread(target=loop.run_forever, daemon=True).start()
+    return f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}", paths
+
+
+def fake_tzkt(keys: dict):
+    # serves /bigmaps/{id}/keys the way tzkt filters it: value.status, key.gt / key.ge / key.le, limited pages
+    calls = []
+
+    def http_get(url, params):
+        calls.append(params)
+        page = [
+            {"key": str(key), "value": value, "firstLevel": 100 + key}
+            for key, value in sorted(keys.items())
+            if key > int(params.get("key.gt", -1)) and int(params.get("key.ge", 0)) <= key
+            and key <= int(params.get("key.le", key)) and not (params.get("value.status") == "false" and value["status"])
+        ][:params["limit"]]
+        return MagicMock(json=MagicMock(return_value=page))
+
+    return http_get, calls
+
+
+class FeederTest(TestCase):
+
+    ###########
+    # scanner #
+    ###########
+
+    def test_scan_indexes_pending_requests_by_id_and_pair(self):
+        keys = {i: pending_request("BTCETH" if i % 2 else "XTZBTC") for i in range(0, 10)}
+        keys[4]["status"] = True
+        http_get, calls = fake_tzkt(keys)
+        scanner = PendingRequests(big_map_id, page_size=4, http_get=http_get)
+
+        self.assertEqual(9, scanner.scan())
+        self.assertEqual(3, len(calls))
+        self.assertEqual(9, scanner.last_seen)
+        self.assertEqual({1, 3, 5, 7, 9}, scanner.by_pair["BTCETH"])
+        self.assertEqual({0, 2, 6, 8}, scanner.by_pair["XTZBTC"])
+
+    def test_scan_only_fetches_new_keys(self):
+        keys = {i: pending_request() for i in range(0, 3)}
+        http_get, calls = fake_tzkt(keys)
+        scanner = PendingRequests(big_map_id, http_get=http_get)
+        scanner.scan()
+        keys[3] = pending_request()
+
+        self.assertEqual(1, scanner.scan())
+        self.assertEqual(2, calls[-1]["key.gt"])
+        self.assertEqual([0, 1, 2, 3], [request_id for request_id, _ in scanner.pending()])
+
+    def test_only_requests_made_by_the_snapshot_level_are_settled(self):
+        http_get, _ = fake_tzkt({i: pending_request() for i in range(0, 4)})
+        scanner = PendingRequests(big_map_id, http_get=http_get)
+        scanner.scan()
+        scanner.add(7, pending_request())  # handed back by the injector
+        self.assertEqual([True, True, False, True], [scanner.settled(i, 102) for i in (1, 2, 3, 7)])
+        self.assertFalse(scanner.settled(0, None))
+        scanner.remove(3)
+        self.assertNotIn(3, scanner.levels)
+
+    def test_remove_drops_empty_pairs(self):
+        scanner = PendingRequests(big_map_id)
+        scanner.add(0, pending_request())
+        scanner.remove(0)
+        scanner.remove(0)
+        self.assertEqual(0, len(scanner))
+        self.assertEqual({}, scanner.by_pair)
+
+    ###########
+    # serving #
+    ###########
+
+    def test_serve_batches_every_pending_request(self):
+        injector, contract = MagicMock(), MagicMock()
+        scanner = PendingRequests(big_map_id)
+        for i in range(0, 44):
+            scanner.add(i, pending_request())
+        data_feed.serve(injector, contract, scanner, {"BTCETH": to_quote(ticker("BTCETH"))}, 7)
+        self.assertEqual(0, len(scanner))
+        self.assertEqual(44, contract.update.call_count)
+        self.assertEqual([20, 20, 4], [len(c.args[0]) for c in injector.inject.call_args_list])
+        self.assertEqual(list(range(40, 44)), list(injector.inject.call_args.args[1]))
+
+    def test_serve_keeps_requests_of_failed_batches(self):
+        injector, contract = MagicMock(), MagicMock()
+        injector.inject.side_effect = ["oo1", RuntimeError("node down")]
+        scanner = PendingRequests(big_map_id)
+        for i in range(0, 30):
+            scanner.add(i, pending_request())
+        data_feed.serve(injector, contract, scanner, {"BTCETH": to_quote(ticker("BTCETH"))}, 7)
+        self.assertEqual(list(range(20, 30)), [request_id for request_id, _ in scanner.pending()])
+
+    def test_serve_isolates_the_calls_failing_on_chain(self):
+        injector, contract = MagicMock(), MagicMock()
+        contract.update.side_effect = lambda data: f"update {data['request_id']}"
+        injected = []
+
+        def inject(calls, requests, level):
+            if "update 13" in calls or "update 30" in calls:
+                raise RpcError("proto.011-PtHangz2.michelson_v1.script_rejected")
+            injected.extend(requests)
+            return "oo"
+
+        injector.inject.side_effect = inject
+        scanner = PendingRequests(big_map_id)
+        for i in range(0, 44):
+            scanner.add(i, pending_request())
+        skipped = data_feed.serve(injector, contract, scanner, {"BTCETH": to_quote(ticker("BTCETH"))}, 7)
+        self.assertEqual([13, 30], skipped)
+        self.assertEqual(0, len(scanner))  # the others are in flight, the failing ones retired
+        self.assertEqual(sorted(set(range(0, 44)) - {13, 30}), sorted(injected))
+
+    def test_serve_prices_every_pair_from_one_snapshot(self):
+        injector, contract = MagicMock(), MagicMock()
+        scanner = PendingRequests(big_map_id)
+        scanner.add(0, pending_request("BTCETH"))
+        scanner.add(1, pending_request("XTZBTC"))
+        scanner.add(2, pending_request("DOGEBTC"))
+        data_feed.serve(injector, contract, scanner, {pair: to_quote(ticker(pair)) for pair in ["BTCETH", "XTZBTC"]}, 7)
+        self.assertEqual(["BTCETH", "XTZBTC"], [c.args[0]["pair"] for c in contract.update.call_args_list])
+        self.assertEqual(1, contract.update.call_args.args[0]["request_id"])
+        self.assertEqual([2], [request_id for request_id, _ in scanner.pending()])
+
+    ############
+    # injector #
+    ############
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_inject_chains_counters_without_waiting(self, _):
+        admin = fake_chain({})
+        injector = Injector(admin)
+        injector.inject(["update 0", "update 1"], {0: pending_request(), 1: pending_request()}, 10)
+        injector.inject(["update 2"], {2: pending_request()}, 10)
+        counters = [[c["counter"] for c in g.contents] for g in admin.bulk.return_value.autofill.side_effect.groups]
+        self.assertEqual([["41", "42"], ["43"]], counters)
+        self.assertEqual(1, admin.account.call_count)
+        self.assertEqual(2, len(injector))
+        self.assertTrue(all(g.sign.return_value.inject.call_args.kwargs == {"min_confirmations": 0}
+                            for g in admin.bulk.return_value.autofill.side_effect.groups))
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_inject_reuses_the_first_simulation_estimates(self, _):
+        admin = fake_chain({})
+        injector = Injector(admin)
+        injector.inject(["update 0"], {0: pending_request()}, 10)
+        injector.inject(["update 1", "update 2"], {1: pending_request(), 2: pending_request()}, 10)
+        self.assertEqual(1, admin.bulk.return_value.autofill.call_count)
+        self.assertEqual({"ttl": 5, "counter": 42, "gas_limit": 3000, "storage_limit": 200},
+                         admin.bulk.return_value.fill.call_args.kwargs)
+        group = admin.bulk.return_value.autofill.side_effect.groups[-1]
+        self.assertEqual([("42", "1500", "1000"), ("43", "1500", "1000")],
+                         [(c["counter"], c["gas_limit"], c["fee"]) for c in group.contents])
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_track_confirms_included_groups(self, _):
+        blocks = {}
+        admin = fake_chain(blocks)
+        injector = Injector(admin, confirmations=2)
+        op_hash = injector.inject(["update 0"], {0: pending_request()}, 10)
+        blocks["BL11"] = [{"hash": op_hash, "contents": [applied()]}]
+        self.assertEqual(({}, {}), injector.track({"hash": "BL11", "level": 11}))
+        blocks["BL12"] = []
+        self.assertEqual(({}, {}), injector.track({"hash": "BL12", "level": 12}))
+        blocks["BL13"] = []
+        confirmed, retry = injector.track({"hash": "BL13", "level": 13})
+        self.assertEqual([0], list(confirmed))
+        self.assertEqual(0, len(injector))
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_track_retries_failed_and_dropped_groups(self, _):
+        blocks = {}
+        admin = fake_chain(blocks)
+        injector = Injector(admin, ttl=2)
+        failed = injector.inject(["update 0"], {0: pending_request()}, 10)
+        injector.inject(["update 1"], {1: pending_request()}, 10)
+        blocks["BL11"] = [{"hash": failed, "contents": [applied("failed")]}]
+        self.assertEqual([0], list(injector.track({"hash": "BL11", "level": 11})[1]))
+        blocks["BL12"], blocks["BL13"] = [], []
+        self.assertEqual([1], list(injector.track({"hash": "BL13", "level": 13})[1]))
+        self.assertIsNone(injector.counter)
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_track_notices_reorged_groups(self, _):
+        blocks = {}
+        admin = fake_chain(blocks)
+        injector = Injector(admin, confirmations=2)
+        op_hash = injector.inject(["update 0"], {0: pending_request()}, 10)
+        blocks["BL11"] = [{"hash": op_hash, "contents": [applied()]}]
+        injector.track({"hash": "BL11", "level": 11})
+        blocks["BL11b"], blocks["BL12b"] = [], []
+        admin.shell.blocks.levels[11] = "BL11b"
+        injector.track({"hash": "BL12b", "level": 12})
+        self.assertIsNone(injector.inflight[op_hash].included)
+        blocks["BL13b"] = [{"hash": op_hash, "contents": [applied()]}]
+        injector.track({"hash": "BL13b", "level": 13})
+        self.assertEqual("BL13b", injector.inflight[op_hash].block)
+
+    #############
+    # preflight #
+    #############
+
+    def test_preflight_drops_calls_that_would_fail_on_chain(self):
+        oracle = ContractInterface.from_michelson(storage_code)
+        snapshot = StorageSnapshot(MagicMock(program=oracle.program))
+        snapshot.storage = oracle.program.storage.from_micheline_value(storage_expr).to_python_object()
+        calls = [
+            (request_id, pending_request(pair), oracle.update({"pair": pair, "request_id": request_id}))
+            for request_id, pair in [(0, "BTCETH"), (1, "XTZBTC"), (2, "BTCETH")]
+        ]
+        retired = []
+        self.assertEqual([0, 2], [c[0] for c in preflight(snapshot, admin_address, calls, 60, retired)])
+        self.assertEqual([1], retired)  # unsupported pair, no later head serves it
+        retired = []
+        self.assertEqual([], preflight(snapshot, "tz1c6PPijJnZYjKiSQND4pMtGMg6csGeAiiF", calls, 60, retired))
+        self.assertEqual([], retired)  # the feeder's key, not the requests, is at fault
+
+    def test_serve_injects_only_the_checked_calls(self):
+        injector, contract = MagicMock(), MagicMock()
+        scanner = PendingRequests(big_map_id)
+        for i in range(0, 3):
+            scanner.add(i, pending_request())
+        data_feed.serve(injector, contract, scanner, {"BTCETH": to_quote(ticker("BTCETH"))}, 7,
+                        check=lambda calls: calls[1:])
+        self.assertEqual([1, 2], list(injector.inject.call_args.args[1]))
+        self.assertEqual([0], [request_id for request_id, _ in scanner.pending()])
+
+    ############
+    # backfill #
+    ############
+
+    def test_scan_range_fetches_one_page_per_window_concurrently(self):
+        keys = {i: pending_request("BTCETH" if i % 2 else "XTZBTC") for i in range(0, 30)}
+        for i in (4, 12, 13):
+            keys[i]["status"] = True
+        http_get, calls = fake_tzkt(keys)
+        barrier = Barrier(3, timeout=5)  # the three windows are in flight at the same time
+
+        def fetch(**kwargs):
+            barrier.wait()
+            return http_get(**kwargs)
+
+        scanner = PendingRequests(big_map_id, page_size=5, http_get=fetch)
+        self.assertEqual(3, scanner.scan_range(3, 17, gather=HttpPool(workers=3).gather))
+        self.assertEqual([(3, 7), (8, 12), (13, 17)], sorted((c["key.ge"], c["key.le"]) for c in calls))
+        self.assertEqual([3, 5, 6, 7, 8, 9, 10, 11, 14, 15, 16, 17], [i for i, _ in scanner.pending()])
+        self.assertEqual(-1, scanner.last_seen)
+
+    def test_scan_range_fails_when_a_window_is_missing(self):
+        http_get, _ = fake_tzkt({i: pending_request() for i in range(0, 10)})
+        scanner = PendingRequests(big_map_id, page_size=5, http_get=http_get)
+        gather = lambda calls: [calls[0]()] + [ConnectionError("indexer down")]
+        self.assertRaises(ConnectionError, scanner.scan_range, 0, 9, gather)
+
+    def test_serve_by_pair_fills_size_capped_batches_pair_after_pair(self):
+        injector, contract = MagicMock(), MagicMock()
+        scanner = PendingRequests(big_map_id)
+        for i in range(0, 9):
+            scanner.add(i, pending_request(["XTZBTC", "BTCETH", "DOGEBTC"][i % 3]))
+        skipped = data_feed.serve(injector, contract, scanner,
+                                  {pair: to_quote(ticker(pair)) for pair in ["BTCETH", "XTZBTC"]}, 7,
+                                  check=lambda calls: [c for c in calls if c[0] != 4], by_pair=True, batch_size=4)
+        self.assertEqual([[1, 7, 0, 3], [6]], [list(c.args[1]) for c in injector.inject.call_args_list])
+        self.assertEqual([2, 5, 8, 4], skipped)
+        self.assertEqual([2, 4, 5, 8], [request_id for request_id, _ in scanner.pending()])
+
+    def test_dry_run_reports_the_groups_without_injecting(self):
+        contract = MagicMock()
+        scanner = PendingRequests(big_map_id)
+        for i in range(0, 5):
+            scanner.add(i, pending_request("XTZBTC" if i < 2 else "BTCETH"))
+        groups = data_feed.report(contract, scanner, {"BTCETH": to_quote(ticker("BTCETH"))}, batch_size=2)
+        self.assertEqual([[2, 3], [4]], groups)
+        self.assertEqual(5, len(scanner))
+        contract.update.return_value.inject.assert_not_called()
+
+    ##########
+    # shards #
+    ##########
+
+    def test_leases_split_requests_by_home_shard(self):
+        with TemporaryDirectory() as directory:
+            path = join(directory, "feeder.leases")
+            first = Leases(path, 0, 2, worker="a", clock=lambda: 0)
+            second = Leases(path, 1, 2, worker="b", clock=lambda: 0)
+            second.renew()
+            self.assertEqual({0}, first.renew())
+            self.assertEqual({1}, second.renew())
+            self.assertEqual([0, 2, 4], [i for i in range(0, 6) if first.owns(i)])
+
+    def test_leases_take_over_expired_shards(self):
+        now = [0]
+        with TemporaryDirectory() as directory:
+            path = join(directory, "feeder.leases")
+            first = Leases(path, 0, 2, worker="a", ttl=60, clock=lambda: now[0])
+            second = Leases(path, 1, 2, worker="b", ttl=60, clock=lambda: now[0])
+            second.renew()
+            now[0] = 30
+            self.assertEqual({0}, first.renew())
+            now[0] = 61
+            self.assertEqual({0, 1}, first.renew())
+            self.assertEqual(set(), second.renew())  # back from the dead, it asks for its home shard
+            self.assertEqual({0, 1}, first.renew(busy={1}))  # until its updates for shard 1 are final
+            self.assertEqual(set(), second.renew())
+            self.assertEqual({0}, first.renew())
+            self.assertEqual({1}, second.renew())
+            self.assertEqual({0}, first.renew())
+
+    def test_leases_never_take_the_shards_of_other_hosts(self):
+        now = [0]
+        with TemporaryDirectory() as directory:
+            first = Leases(join(directory, "a.leases"), 0, 4, range(0, 2), worker="a0", ttl=60, clock=lambda: now[0])
+            remote = Leases(join(directory, "b.leases"), 2, 4, range(2, 4), worker="b2", ttl=60, clock=lambda: now[0])
+            self.assertEqual({0}, first.renew())  # shard 1 waits for its own worker to start
+            self.assertEqual({2}, remote.renew())
+            now[0] = 61
+            self.assertEqual({0, 1}, first.renew())  # its worker never came up
+            self.assertEqual({2, 3}, remote.renew())
+
+    def test_scan_only_indexes_the_owned_shards(self):
+        http_get, _ = fake_tzkt({i: pending_request() for i in range(0, 6)})
+        owned = {1}
+        scanner = PendingRequests(big_map_id, http_get=http_get, owns=lambda request_id: request_id % 3 in owned)
+        self.assertEqual(2, scanner.scan())
+        self.assertEqual([1, 4], [request_id for request_id, _ in scanner.pending()])
+        self.assertEqual(5, scanner.last_seen)
+        owned = {0}
+        scanner.retain(scanner.owns)
+        self.assertEqual(0, len(scanner))
+        self.assertEqual({}, scanner.by_pair)
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_track_finds_groups_included_in_skipped_heads(self, _):
+        blocks = {}
+        admin = fake_chain(blocks)
+        injector = Injector(admin, ttl=2, confirmations=2)
+        op_hash = injector.inject(["update 0"], {0: pending_request()}, 10)
+        blocks["BL11"], blocks["BL12"] = [], [{"hash": op_hash, "contents": [applied()]}]
+        blocks["BL14"] = []
+        confirmed, retry = injector.track({"hash": "BL14", "level": 14})
+        self.assertEqual(([0], {}), (list(confirmed), retry))
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_track_reads_only_the_blocks_within_the_ttl_after_an_outage(self, _):
+        blocks = {"BL11": [], "BL12": [], "BL1000": []}  # any other block read raises a KeyError
+        admin = fake_chain(blocks)
+        injector = Injector(admin, ttl=2, confirmations=2)
+        injector.inject(["update 0"], {0: pending_request()}, 10)
+        confirmed, retry = injector.track({"hash": "BL1000", "level": 1000})
+        self.assertEqual(({}, [0]), (confirmed, list(retry)))
+
+    ##############
+    # checkpoint #
+    ##############
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_checkpoint_resumes_without_serving_twice(self, _):
+        with TemporaryDirectory() as directory:
+            path = join(directory, "feeder.sqlite")
+            keys = {i: pending_request() for i in range(0, 6)}
+            http_get, calls = fake_tzkt(keys)
+            scanner = PendingRequests(big_map_id, http_get=http_get)
+            cache = PriceCache(lambda pairs: {pair: to_quote(ticker(pair)) for pair in pairs})
+            checkpoint = Checkpoint(path)
+            injector = Injector(fake_chain({}), checkpoint=checkpoint)
+            scanner.scan()
+            cache.get_many(["BTCETH"])
+            op_hash = injector.inject(["update 2", "update 3"], {2: keys[2], 3: keys[3]}, 10)
+            for request_id in [0, 1, 2, 3]:
+                scanner.remove(request_id)
+            checkpoint.save(scanner, cache)
+
+            # restart: requests 2 and 3 are still pending on chain until their group is included
+            scanner = PendingRequests(big_map_id, http_get=http_get)
+            cache = PriceCache(MagicMock())
+            injector = Injector(fake_chain({}))
+            Checkpoint(path).restore(scanner, injector, cache)
+            self.assertEqual(3, scanner.last_seen)
+            self.assertEqual({2, 3}, injector.request_ids())
+            self.assertEqual(op_hash, list(injector.inflight)[0])
+            self.assertEqual({"BTCETH": to_quote(ticker("BTCETH"))}, cache.get_many(["BTCETH"]))
+            self.assertIsInstance(cache.get_many(["BTCETH"])["BTCETH"], Quote)
+            scanner.scan()
+            self.assertEqual(3, calls[-1]["key.gt"])
+            self.assertEqual([4, 5], [request_id for request_id, _ in scanner.pending()])
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_checkpoint_forgets_groups_the_node_rejected(self, _):
+        with TemporaryDirectory() as directory:
+            checkpoint = Checkpoint(join(directory, "feeder.sqlite"))
+            admin = unreachable_chain(RpcError("counter_in_the_past"))
+            injector = Injector(admin, checkpoint=checkpoint)
+            with self.assertRaises(RpcError):
+                injector.inject(["update 0"], {0: pending_request()}, 10)
+            self.assertIsNone(injector.counter)
+            self.assertEqual(0, len(injector))
+            self.assertEqual([], checkpoint.db.execute("SELECT * FROM inflight").fetchall())
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_groups_without_an_answer_from_the_node_stay_in_flight(self, _):
+        with TemporaryDirectory() as directory:
+            checkpoint = Checkpoint(join(directory, "feeder.sqlite"))
+            admin = unreachable_chain(ConnectionError("read timed out"))
+            injector = Injector(admin, checkpoint=checkpoint)
+            self.assertEqual("oo0", injector.inject(["update 0"], {0: pending_request()}, 10))
+            self.assertEqual(41, injector.counter)  # the next group is chained after it
+            self.assertEqual({0}, injector.request_ids())
+            self.assertEqual(1, len(checkpoint.db.execute("SELECT * FROM inflight").fetchall()))
+
+    ###########
+    # sources #
+    ###########
+
+    def test_hedge_a_source_slower_than_usual(self):
+        slow, fast = FakeSource("slow", 1, delay=1), FakeSource("fast", 2)
+        quotes = HedgedQuotes([slow, fast], executor=HttpPool(workers=4).executor)
+        quotes.latencies["slow"].extend([0.01] * 20)
+        start = monotonic()
+        self.assertEqual(2, quotes.fetch(["BTCETH"])["BTCETH"]["last_price"])
+        self.assertLess(monotonic() - start, 0.5)
+        self.assertEqual(1, len(quotes.latencies["fast"]))
+
+    def test_no_hedge_while_the_source_is_on_time(self):
+        first, second = FakeSource("first", 1, delay=0.05), FakeSource("second", 2)
+        quotes = HedgedQuotes([first, second], executor=HttpPool(workers=4).executor)
+        quotes.latencies["first"].extend([0.2] * 20)
+        self.assertEqual(1, quotes.fetch(["BTCETH"])["BTCETH"]["last_price"])
+        self.assertEqual(0, second.calls)
+
+    def test_quorum_quotes_are_aggregated_by_median(self):
+        sources = [FakeSource("a", 10), FakeSource("b", 30), FakeSource("c", 20, pairs=["XTZBTC"]),
+                   FakeSource("d", 1000, delay=1)]
+        quotes = HedgedQuotes(sources, quorum=3, executor=HttpPool(workers=4).executor).fetch(["BTCETH"])
+        self.assertEqual(20, quotes["BTCETH"]["last_price"])
+        self.assertEqual(20, quotes["XTZBTC"]["last_price"])  # only quoted by c
+        self.assertEqual("BTCETH", quotes["BTCETH"]["pair"])
+        self.assertIsInstance(quotes["BTCETH"], Quote)
+
+    def test_pairs_a_source_does_not_list_are_asked_to_the_next_one(self):
+        binance, kucoin = FakeSource("binance", 1, listed={"BTCETH"}), FakeSource("kucoin", 2)
+        quotes = HedgedQuotes([binance, kucoin], executor=HttpPool(workers=4).executor)
+        quotes.latencies["binance"].extend([1] * 20)  # on time, no hedge because of the latency
+        fetched = quotes.fetch(["BTCETH", "XTZBTC"])
+        self.assertEqual(2, fetched["XTZBTC"]["last_price"])
+        self.assertEqual(1, kucoin.calls)
+
+    def test_failed_sources_are_replaced_and_the_budget_holds(self):
+        quotes = HedgedQuotes([FakeSource("down", 1, error=True), FakeSource("up", 2)],
+                              executor=HttpPool(workers=4).executor)
+        self.assertEqual(2, quotes.fetch(["BTCETH"])["BTCETH"]["last_price"])
+        quotes = HedgedQuotes([FakeSource("slow", 1, delay=1)], budget=0.1, executor=HttpPool(workers=4).executor)
+        start = monotonic()
+        with self.assertRaises(TimeoutError):
+            quotes.fetch(["BTCETH"])
+        self.assertLess(monotonic() - start, 0.5)
+
+    def test_kucoin_tickers_become_quotes(self):
+        res = MagicMock(content=dumps({"data": {"time": 1_650_086_400_000, "ticker": [
+            {"symbol": "XTZ-BTC", "last": "0.0001", "low": "0.00009", "high": "0.00011", "vol": "10",
+             "volValue": "0.001"},
+            {"symbol": "BTC-USDT", "last": "40000", "low": "1", "high": "1", "vol": "1", "volValue": "1"}
+        ]}}))
+        with patch("feeder.sources.pool.get", return_value=res):
+            quotes = KuCoin().fetch(["XTZBTC"], 1)
+        self.assertEqual(["XTZBTC"], list(quotes))
+        self.assertEqual(10_000, quotes["XTZBTC"]["last_price"])
+        self.assertEqual(1_650_000_000, quotes["XTZBTC"]["open_time"])
+
+    #############
+    # scheduler #
+    #############
+
+    def test_scheduler_follows_the_demand_of_others(self):
+        own = "KT1Hkg5qeNhfwpKW4fXvq7HGZB9z2EnmCCA9%receive_price"
+        updates = [{"value": {**pending_request("BTCETH"), "status": i % 4 == 0}} for i in range(0, 8)]
+        updates.append({"value": {**pending_request("XTZBTC"), "status": False}})
+        updates.append({"value": {**pending_request("BTCETH"), "target_address": own.split("%")[0],
+                                  "target_entrypoint": "receive_price"}})
+        http_get = MagicMock(return_value=MagicMock(json=MagicMock(return_value=updates)))
+        scheduler = RefreshScheduler(big_map_id, own, decay=0.5, http_get=http_get)
+        scheduler.observe(10)
+        http_get.assert_not_called()
+        scheduler.observe(12)
+        self.assertEqual({"level.gt": 10, "level.le": 12, "action": "add_key"},
+                         {k: http_get.call_args.kwargs["params"][k] for k in ["level.gt", "level.le", "action"]})
+        self.assertEqual({"BTCETH": 3, "XTZBTC": 0.375}, scheduler.demand)  # 2 blocks: 1 - 0.5 ** 2 new
+        self.assertEqual(2 / 9, scheduler.ratio())
+
+    def test_scheduler_refreshes_hot_pairs_within_budget(self):
+        scheduler = RefreshScheduler(big_map_id, "KT1Hkg5qeNhfwpKW4fXvq7HGZB9z2EnmCCA9%receive_price",
+                                     budget=10_000, window=10, hot=0.5)
+        scheduler.demand = {"BTCETH": 3, "XTZBTC": 2, "ETHUSD": 1, "DOGEBTC": 0.1}
+        supported = {"BTCETH", "XTZBTC", "ETHUSD", "DOGEBTC"}
+        self.assertEqual(["BTCETH", "ETHUSD"], scheduler.plan(1, supported, {"XTZBTC"}, 4_000))
+        self.assertEqual(["BTCETH", "XTZBTC"], scheduler.plan(2, supported, set(), 4_000))  # nothing injected
+        scheduler.spend(1, ["BTCETH", "ETHUSD"], 4_000)
+        self.assertEqual([], scheduler.plan(5, supported, set(), 4_000))
+        self.assertEqual(["BTCETH", "XTZBTC"], scheduler.plan(11, supported, set(), 4_000))
+
+    def test_refresh_failures_leave_the_budget_and_the_tick_alone(self):
+        scheduler = RefreshScheduler(big_map_id, "KT1Hkg5qeNhfwpKW4fXvq7HGZB9z2EnmCCA9%receive_price",
+                                     budget=10_000, hot=0.5)
+        scheduler.level, scheduler.demand = 10, {"BTCETH": 3}
+        snapshot = MagicMock(storage={"request_price": 1000}, supported_pairs={"BTCETH"})
+        injector = MagicMock(inject=MagicMock(side_effect=RuntimeError("node down")))
+        data_feed.refresh(scheduler, injector, MagicMock(), snapshot, PendingRequests(big_map_id), 10)
+        self.assertEqual("get_price", injector.inject.call_args.kwargs["entrypoint"])
+        self.assertEqual([], list(scheduler.spent))
+        injector.inject.side_effect = None
+        data_feed.refresh(scheduler, injector, MagicMock(), snapshot, PendingRequests(big_map_id), 10)
+        self.assertEqual([(10, 1000 + data_feed.REFRESH_FEE)], list(scheduler.spent))
+
+    @patch("feeder.injector.calculate_fee", return_value=1000)
+    def test_inject_learns_the_limits_of_every_entrypoint(self, _):
+        admin = fake_chain({})
+        injector = Injector(admin)
+        injector.inject(["update 0"], {0: pending_request()}, 10)
+        injector.inject(["get_price BTCETH"], {}, 10, entrypoint="get_price")
+        injector.inject(["update 1"], {1: pending_request()}, 10)
+        self.assertEqual(2, admin.bulk.return_value.autofill.call_count)
+        self.assertEqual({"update", "get_price"}, set(injector.limits))
+
+    def test_scheduler_requests_pay_the_request_price(self):
+        contract = MagicMock()
+        scheduler = RefreshScheduler(big_map_id, "KT1Hkg5qeNhfwpKW4fXvq7HGZB9z2EnmCCA9%receive_price")
+        scheduler.requests(contract, ["BTCETH"], 1000)
+        self.assertEqual({"pair": "BTCETH", "target": "KT1Hkg5qeNhfwpKW4fXvq7HGZB9z2EnmCCA9%receive_price",
+                          "target_address": "KT1Hkg5qeNhfwpKW4fXvq7HGZB9z2EnmCCA9",
+                          "target_entrypoint": "receive_price"}, contract.get_price.call_args.args[0])
+        contract.get_price.return_value.with_amount.assert_called_once_with(1000)
+
+    ##########
+    # stream #
+    ##########
+
+    @skipIf(websockets is None, "websockets isn't installed")
+    def test_stream_keeps_the_pushed_tickers(self):
+        url, paths = stand_in_exchange([ticker_event("BTCETH", "12.5"), ticker_event("XTZBTC", "0.0001")])
+        stream = TickerStream(url)
+        stream.start(["XTZBTC", "BTCETH"])
+        try:
+            deadline = monotonic() + 5
+            while len(stream.get_many(["BTCETH", "XTZBTC"])) < 2 and monotonic() < deadline:
+                sleep(0.01)
+            quotes = stream.get_many(["BTCETH", "XTZBTC"])
+            self.assertEqual(1_250_000_000, quotes["BTCETH"]["last_price"])
+            self.assertEqual(10_000, quotes["XTZBTC"]["last_price"])
+            self.assertEqual(["/stream?streams=btceth@ticker/xtzbtc@ticker"], paths)
+        finally:
+            stream.close()
+
+    @skipIf(websockets is None, "websockets isn't installed")
+    def test_stale_streamed_pairs_fall_back_to_rest(self):
+        now = [0]
+        stream = TickerStream(stale=10, clock=lambda: now[0])
+        stream.push(ticker_event("BTCETH", "12.5")["data"])
+        now[0] = 5
+        stream.push(ticker_event("XTZBTC", "0.0001")["data"])
+        now[0] = 12
+        cache = PriceCache(lambda pairs: {pair: {"pair": pair, "rest": True} for pair in pairs})
+        quotes = data_feed.quotes_for(["BTCETH", "XTZBTC", "DOGEBTC"], cache, stream)
+        self.assertEqual({"BTCETH", "DOGEBTC"}, {pair for pair, quote in quotes.items() if quote.get("rest")})
+        self.assertEqual(10_000, quotes["XTZBTC"]["last_price"])
+
+    ##########
+    # prices #
+    ##########
+
+    def test_fetch_tickers_asks_every_symbol_at_once(self):
+        http_get = MagicMock(return_value=MagicMock(content=dumps([ticker("XTZBTC"), ticker("BTCETH")])))
+        tickers = fetch_tickers(["XTZBTC", "BTCETH"], http_get=http_get)
+        self.assertEqual('["BTCETH","XTZBTC"]', http_get.call_args.kwargs["params"]["symbols"])
+        self.assertEqual({"BTCETH", "XTZBTC"}, set(tickers))
+
+    def test_binance_leaves_unlisted_pairs_out_of_the_ticker_call(self):
+        def get(url, params, timeout):
+            if url.endswith("/exchangeInfo"):
+                return MagicMock(content=dumps({"symbols": [{"symbol": "XTZBTC", "status": "TRADING"},
+                                                            {"symbol": "LUNABTC", "status": "BREAK"}]}))
+            return MagicMock(content=dumps([ticker(pair) for pair in loads(params["symbols"])]))
+
+        clock = MagicMock(return_value=0)
+        source = Binance(clock=clock)
+        with patch("feeder.sources.pool.get", side_effect=get) as http_get:
+            self.assertEqual(["XTZBTC"], list(source.fetch(["BTCETH", "LUNABTC", "XTZBTC"], 1)))
+            source.fetch(["XTZBTC"], 1)
+            self.assertEqual(3, http_get.call_count)  # the listing is read once per ttl
+            clock.return_value = 3601
+            source.fetch(["XTZBTC"], 1)
+            self.assertEqual(5, http_get.call_count)
+
+    def test_to_quote_scales_prices(self):
+        quote = to_quote(ticker("BTCETH"))
+        self.assertEqual(1_650_000_000, quote["open_time"])
+        self.assertEqual(1_250_000_000, quote["last_price"])
+        self.assertEqual(150_000_000_000, quote["volume"])
+
+    def test_to_quote_is_exact_for_large_volumes(self):
+        quote = to_quote({**ticker("BTCETH"), "volume": "123456789012.12345678", "quoteVolume": "0.1"})
+        self.assertEqual(12_345_678_901_212_345_678, quote["volume"])
+        self.assertEqual(10_000_000, quote["quote_volume"])
+
+    def test_scale_truncates_past_eight_decimals(self):
+        self.assertEqual([1_250_000_000, 12, 50_000_000, 1_000, 0], [
+            scale("12.5"), scale("0.000000129"), scale(".5"), scale("1e-5"), scale("0")
+        ])
+        self.assertEqual([1_234, 1_234], [scale("1.2345e-05"), scale(1.2345e-05)])  # 8 characters after the dot
+
+    def test_quotes_read_like_dicts(self):
+        quote = to_quote(ticker("BTCETH"))
+        self.assertIsInstance(quote, Quote)
+        self.assertEqual(dict(quote), {**quote})
+        self.assertEqual({"pair": "BTCETH", "request_id": 1},
+                         {k: v for k, v in data_feed.build_update(1, pending_request(), quote).items()
+                          if k in ("pair", "request_id")})
+        with self.assertRaises(KeyError):
+            quote["keys"]
+
+    #########
+    # cache #
+    #########
+
+    def test_cache_reuses_fresh_quotes(self):
+        now = [0]
+        fetch = MagicMock(side_effect=lambda pairs: {pair: {"pair": pair, "at": now[0]} for pair in pairs})
+        cache = PriceCache(fetch, ttl=30, clock=lambda: now[0])
+        cache.get_many(["BTCETH"])
+        now[0] = 10
+        quotes = cache.get_many(["BTCETH", "XTZBTC"])
+        self.assertEqual({"BTCETH": 0, "XTZBTC": 10}, {pair: quote["at"] for pair, quote in quotes.items()})
+        now[0] = 31
+        self.assertEqual(31, cache.get_many(["BTCETH"])["BTCETH"]["at"])
+        self.assertEqual([["BTCETH"], ["XTZBTC"], ["BTCETH"]], [c.args[0] for c in fetch.call_args_list])
+
+    def test_cache_evicts_least_recently_used_pairs(self):
+        cache = PriceCache(lambda pairs: {pair: {} for pair in pairs}, size=2)
+        cache.get_many(["A", "B"])
+        cache.get_many(["A"])
+        cache.get_many(["C"])
+        self.assertEqual(["A", "C"], list(cache.quotes))
+
+    def test_cache_coalesces_concurrent_misses(self):
+        started, release = Event(), Event()
+        calls = []
+
+        def fetch(pairs):
+            calls.append(pairs)
+            started.set()
+            release.wait(5)
+            return {pair: {"pair": pair} for pair in pairs}
+
+        cache = PriceCache(fetch)
+        http = HttpPool(workers=2)
+        first = http.executor.submit(cache.get_many, ["BTCETH"])
+        started.wait(5)
+        second = http.executor.submit(cache.get_many, ["BTCETH"])
+        release.set()
+        self.assertEqual(first.result(5), second.result(5))
+        self.assertEqual([["BTCETH"]], calls)
+
+    ############
+    # snapshot #
+    ############
+
+    def test_snapshot_reads_storage_once_per_head(self):
+        contract = MagicMock(program=ContractInterface.from_michelson(storage_code).program)
+        read = contract.shell.blocks.__getitem__.return_value.context.contracts.__getitem__.return_value.storage
+        read.return_value = storage_expr
+        snapshot = StorageSnapshot(contract)
+
+        self.assertTrue(snapshot.load("BLa"))
+        self.assertFalse(snapshot.load("BLa"))
+        self.assertEqual(1, read.call_count)
+        contract.shell.blocks.__getitem__.assert_called_with("BLa")
+        self.assertEqual(3, snapshot.counter)
+        self.assertEqual({"BTCETH"}, snapshot.supported_pairs)
+        self.assertEqual({"tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK"}, snapshot.whitelist)
+        self.assertEqual({"BTCETH": 12}, snapshot.prices)
+        self.assertTrue(snapshot.load("BLb"))  # same level after a reorg, another hash
+        self.assertEqual(2, read.call_count)
+        contract.shell.blocks.__getitem__.assert_called_with("BLb")
+
+    ########
+    # http #
+    ########
+
+    def test_pool_keeps_one_session_per_host(self):
+        http = HttpPool()
+        self.assertIs(http.session("https://api.binance.com/a"), http.session("https://api.binance.com/b"))
+        self.assertIsNot(http.session("https://api.binance.com"), http.session("https://api.tzkt.io"))
+
+    def test_gather_runs_calls_concurrently_and_keeps_errors(self):
+        http = HttpPool(workers=4)
+        barrier = Barrier(3, timeout=5)
+
+        def fail():
+            raise ValueError("boom")
+
+        results = http.gather([barrier.wait, barrier.wait, barrier.wait, fail])
+        self.assertEqual(3, len([r for r in results if isinstance(r, int)]))
+        self.assertIsInstance(results[3], ValueError)
+
+    #########
+    # heads #
+    #########
+
+    def test_watch_heads_follows_the_monitoring_stream(self):
+        lines = [b'{"hash": "BLa", "level": 1}', b'', b'{"hash": "BLb", "level": 2}']
+        res = MagicMock(iter_lines=MagicMock(return_value=lines))
+        res.__enter__.return_value = res
+        heads = watch_heads("http://node", http_get=MagicMock(return_value=res), wait=MagicMock())
+        self.assertEqual(["BLa", "BLb"], [next(heads)["hash"], next(heads)["hash"]])
+
+    def test_watch_heads_polls_with_backoff_when_streaming_fails(self):
+        waits = []
+
+        def http_get(url, **kwargs):
+            if "monitor" in url:
+                raise ConnectionError("streaming disabled")
+            if len(waits) < 4:
+                raise ConnectionError("rpc down")
+            return MagicMock(json=MagicMock(return_value={"hash": "BLa", "level": 1}))
+
+        heads = watch_heads("http://node", poll_interval=5, http_get=http_get, wait=waits.append)
+        self.assertEqual("BLa", next(heads)["hash"])
+        self.assertEqual([1, 2, 4, 8], waits)
+
+    ###########
+    # metrics #
+    ###########
+
+    def test_metrics_render_the_prometheus_text_format(self):
+        registry = Metrics()
+        registry.inc("feeder_operations_total", status="injected")
+        registry.inc("feeder_operations_total", status="injected")
+        registry.set("feeder_backlog", 3)
+        for seconds in (0.2, 0.7, 99):
+            registry.observe("feeder_http_seconds", seconds, buckets=(0.5, 1), host="api.tzkt.io")
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE feeder_backlog gauge", lines)
+        self.assertIn('feeder_operations_total{status="injected"} 2', lines)
+        self.assertEqual([
+            "# TYPE feeder_http_seconds histogram",
+            'feeder_http_seconds_bucket{host="api.tzkt.io",le="0.5"} 1',
+            'feeder_http_seconds_bucket{host="api.tzkt.io",le="1"} 2',
+            'feeder_http_seconds_bucket{host="api.tzkt.io",le="+Inf"} 3',
+            'feeder_http_seconds_sum{host="api.tzkt.io"} 99.9',
+            'feeder_http_seconds_count{host="api.tzkt.io"} 3',
+        ], lines[lines.index("# TYPE feeder_http_seconds histogram"):][:6])
+
+    def test_metrics_endpoint_serves_the_registry(self):
+        registry = Metrics()
+        registry.set("feeder_backlog", 5)
+        server = registry.serve(0)
+        try:
+            with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as res:
+                self.assertIn("feeder_backlog 5", res.read().decode())
+        finally:
+            server.shutdown()
+
+    def test_tracer_closes_spans_into_stage_histograms_on_confirmation(self):
+        registry = Metrics()
+        now = [0]
+        tracer = Tracer(registry, clock=lambda: now[0])
+        tracer.discover(1, level=100)
+        for stage, at in [("fetch", 2), ("build", 3), ("inject", 5)]:
+            now[0] = at
+            tracer.mark([1], stage)
+        now[0] = 65
+        tracer.confirm([1], level=103)
+
+        text = registry.render()
+        self.assertIn('feeder_stage_seconds_sum{stage="confirm"} 60', text)
+        self.assertIn('feeder_stage_seconds_sum{stage="inject"} 2', text)
+        self.assertIn("feeder_request_seconds_sum 65", text)
+        self.assertIn("feeder_fulfilment_blocks_sum 3", text)
+        self.assertEqual({}, tracer.spans)
+
+    def test_tracer_keeps_a_bounded_number_of_open_spans(self):
+        tracer = Tracer(Metrics(), max_spans=2)
+        for request_id in range(3):
+            tracer.discover(request_id, level=1)
+        self.assertEqual([1, 2], list(tracer.spans))
+        self.assertEqual([1, 2], list(tracer.levels))
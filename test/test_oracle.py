@@ -1,12 +1,13 @@
 from unittest import TestCase
 from contextlib import contextmanager
-from copy import deepcopy
-from pytezos import ContractInterface, MichelsonRuntimeError, pytezos
+from pytezos import MichelsonRuntimeError, pytezos
 from datetime import datetime
 from pytezos.michelson.types.big_map import big_map_diff_to_lazy_diff
 from pytezos.michelson.types.option import OptionType
 from pytezos.michelson.types.option import SomeLiteral, NoneLiteral
 
+from oracle_harness import StorageTemplate, load_oracle
+
 
 def date_to_string(date: int) -> str:
     return str(datetime.utcfromtimestamp(date).strftime('%Y-%m-%dT%H:%M:%SZ'))
@@ -50,30 +51,32 @@ open_time = date_to_string(open_timestamp)
 close_time = date_to_string(close_timestamp)
 update_time = date_to_string(update_timestamp)
 
-initial_storage = ContractInterface.from_file(compiled_contract_path).storage.dummy()
-initial_storage["admin"] = admin
-initial_storage["counter"] = 0
-initial_storage["request_price"] = 1000
-initial_storage["supported_pairs"] = ["BTCETH"]
-initial_storage["prices"] = {
-    "BTCETH": {
-        "pair": "BTCETH",
-        "update_time": update_timestamp,
-        "open_time": open_timestamp,
-        "close_time": close_timestamp,
-        "last_price": last_price,
-        "low_price": btc_low_price,
-        "high_price": btc_high_price,
-        "volume": volume,
-        "quote_volume": quote_volume
+initial_storage = StorageTemplate({
+    **load_oracle(compiled_contract_path).storage.dummy(),
+    "admin": admin,
+    "counter": 0,
+    "request_price": 1000,
+    "supported_pairs": ["BTCETH"],
+    "prices": {
+        "BTCETH": {
+            "pair": "BTCETH",
+            "update_time": update_timestamp,
+            "open_time": open_timestamp,
+            "close_time": close_timestamp,
+            "last_price": last_price,
+            "low_price": btc_low_price,
+            "high_price": btc_high_price,
+            "volume": volume,
+            "quote_volume": quote_volume
+        }
     }
-}
+})
 
 
 class OracleContractTest(TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.oracle = ContractInterface.from_file(compiled_contract_path)
+        cls.oracle = load_oracle(compiled_contract_path)
         cls.maxDiff = None
 
     @contextmanager
@@ -93,7 +96,7 @@ class OracleContractTest(TestCase):
 
     def test_set_admin_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         res = self.oracle.set_admin(bob).interpret(storage=init_storage, sender=admin)
         self.assertEqual(bob, res.storage["admin"])
@@ -101,14 +104,14 @@ class OracleContractTest(TestCase):
 
     def test_set_admin_not_admin_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(only_admin):
             self.oracle.set_admin(bob).interpret(storage=init_storage, sender=alice)
 
     def test_set_admin_sending_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_must_be_zero_tez):
             self.oracle.set_admin(bob).interpret(storage=init_storage, sender=admin, amount=1)
@@ -118,7 +121,7 @@ class OracleContractTest(TestCase):
     ##################
     def test_whitelist_user_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         res = self.oracle.whitelist_user(bob).interpret(storage=init_storage, sender=admin)
         self.assertEqual(bob, res.storage["whitelist"].pop())
@@ -126,21 +129,21 @@ class OracleContractTest(TestCase):
 
     def test_whitelist_user_not_admin_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(only_admin):
             self.oracle.whitelist_user(bob).interpret(storage=init_storage, sender=alice)
 
     def test_whitelist_user_sending_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_must_be_zero_tez):
             self.oracle.whitelist_user(bob).interpret(storage=init_storage, sender=admin, amount=1)
 
     def test_whitelist_user_already_whitelisted_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         init_storage["whitelist"] = [bob]
         # Execute entrypoint
         with self.raisesMichelsonError(already_whitelisted):
@@ -151,7 +154,7 @@ class OracleContractTest(TestCase):
     ##################
     def test_blacklist_user_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         init_storage["whitelist"] = [bob]
         # Execute entrypoint
         res = self.oracle.blacklist_user(bob).interpret(storage=init_storage, sender=admin)
@@ -160,21 +163,21 @@ class OracleContractTest(TestCase):
 
     def test_blacklist_user_not_admin_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(only_admin):
             self.oracle.blacklist_user(bob).interpret(storage=init_storage, sender=alice)
 
     def test_blacklist_user_sending_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_must_be_zero_tez):
             self.oracle.blacklist_user(bob).interpret(storage=init_storage, sender=admin, amount=1)
 
     def test_blacklist_user_already_blacklisted_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(already_blacklisted):
             self.oracle.blacklist_user(bob).interpret(storage=init_storage, sender=admin)
@@ -184,7 +187,7 @@ class OracleContractTest(TestCase):
     ##################
     def test_whitelist_pair_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         res = self.oracle.whitelist_pair("BTCXTZ").interpret(storage=init_storage, sender=admin)
         self.assertEqual("BTCXTZ", res.storage["supported_pairs"].pop())
@@ -192,21 +195,21 @@ class OracleContractTest(TestCase):
 
     def test_whitelist_pair_not_admin_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(only_admin):
             self.oracle.whitelist_pair("BTCXTZ").interpret(storage=init_storage, sender=alice)
 
     def test_whitelist_pair_sending_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_must_be_zero_tez):
             self.oracle.whitelist_pair("BTCXTZ").interpret(storage=init_storage, sender=admin, amount=1)
 
     def test_whitelist_pair_already_whitelisted_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(already_supported):
             self.oracle.whitelist_pair("BTCETH").interpret(storage=init_storage, sender=admin)
@@ -216,7 +219,7 @@ class OracleContractTest(TestCase):
     ##################
     def test_blacklist_pair_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         res = self.oracle.blacklist_pair("BTCETH").interpret(storage=init_storage, sender=admin)
         self.assertEqual([], res.storage["supported_pairs"])
@@ -224,21 +227,21 @@ class OracleContractTest(TestCase):
 
     def test_blacklist_pair_not_admin_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(only_admin):
             self.oracle.blacklist_pair("BTCETH").interpret(storage=init_storage, sender=alice)
 
     def test_blacklist_pair_sending_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_must_be_zero_tez):
             self.oracle.blacklist_pair("BTCETH").interpret(storage=init_storage, sender=admin, amount=1)
 
     def test_blacklist_pair_already_blacklisted_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(pair_not_supported):
             self.oracle.blacklist_pair("BTCXTZ").interpret(storage=init_storage, sender=admin)
@@ -249,7 +252,7 @@ class OracleContractTest(TestCase):
 
     def test_change_price_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         new_price = 100
         # Execute entrypoint
         res = self.oracle.change_request_price(new_price).interpret(storage=init_storage, sender=admin)
@@ -258,14 +261,14 @@ class OracleContractTest(TestCase):
 
     def test_change_price_not_admin_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(only_admin):
             self.oracle.change_request_price(100).interpret(storage=init_storage, sender=alice)
 
     def test_change_price_sending_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_must_be_zero_tez):
             self.oracle.change_request_price(100).interpret(storage=init_storage, sender=admin, amount=1)
@@ -280,7 +283,7 @@ class OracleContractTest(TestCase):
     ###############
     def test_harvest_xtz_admin_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         res = self.oracle.harvest_xtz(admin).interpret(storage=init_storage, sender=admin)
         print()
@@ -298,7 +301,7 @@ class OracleContractTest(TestCase):
     #############
     def test_get_price_should_work_and_respond(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         params = {
             "pair": "BTCETH",
@@ -338,7 +341,7 @@ class OracleContractTest(TestCase):
 
     def test_get_price_should_work_and_not_respond(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         params = {
             "pair": "BTCETH",
@@ -362,7 +365,7 @@ class OracleContractTest(TestCase):
 
     def test_get_price_not_supported_currency_should_not_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         # Execute entrypoint
         params = {
             "pair": "BTCXTZ",
@@ -379,7 +382,7 @@ class OracleContractTest(TestCase):
 
     def test_update_whitelisted_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         init_storage["whitelist"] = [bob]
         init_storage["requests"] = {
             0: {
@@ -448,7 +451,7 @@ class OracleContractTest(TestCase):
 
     def update_blacklisted_should_not_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = initial_storage()
         update_open_timestamp = 15
         update_close_timestamp = 30
         update_last_price = 1003
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from oracle_harness import (REQUEST_PRICE, STEPS, OracleModel, StorageTemplate, admin, alice, bob, fuzz,
+                            get_price_params, load_oracle, oscar, replay, request_not_found, not_whitelisted,
+                            update_params)
+
+initial_storage = StorageTemplate({
+    **load_oracle().storage.dummy(),
+    "admin": admin,
+    "counter": 0,
+    "request_price": REQUEST_PRICE,
+    "supported_pairs": ["BTCETH", "XTZUSDT"],
+    "whitelist": [admin, bob],
+    "prices": {},
+    "requests": {}
+})
+
+
+class OracleScenarioTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.oracle = load_oracle()
+
+    def test_replay_serves_a_request_and_answers_the_next_one_inline(self):
+        steps = [
+            ("get_price", get_price_params("BTCETH"), alice, REQUEST_PRICE, 10),
+            ("update", update_params("BTCETH", 0), oscar, 0, 20),
+            ("update", update_params("BTCETH", 1), bob, 0, 20),
+            ("update", update_params("BTCETH", 0), bob, 0, 20),
+            ("get_price", get_price_params("BTCETH"), alice, REQUEST_PRICE, 20),
+        ]
+        errors, storage = replay(self.oracle, initial_storage(), steps)
+        self.assertEqual([None, not_whitelisted, request_not_found, None, None], errors)
+        self.assertEqual(2, storage["counter"])
+        self.assertEqual(20, storage["prices"]["BTCETH"]["update_time"])
+        self.assertEqual([True, True], [storage["requests"][i]["status"] for i in range(2)])
+
+    def test_replay_leaves_the_given_storage_untouched(self):
+        storage = initial_storage()
+        replay(self.oracle, storage, [("get_price", get_price_params("BTCETH"), alice, REQUEST_PRICE, 10)])
+        self.assertEqual(initial_storage(), storage)
+
+    def test_model_agrees_with_the_contract_on_random_sequences(self):
+        for seed in range(3):
+            self.assertEqual([], fuzz(self.oracle, initial_storage(), seed, STEPS), f"seed {seed}")
+
+    def test_model_rejects_like_the_contract(self):
+        model = OracleModel(initial_storage())
+        self.assertEqual(not_whitelisted, model.update(update_params("BTCETH", 0), oscar, 0, 0))
+        self.assertIsNone(model.get_price(get_price_params("BTCETH"), alice, REQUEST_PRICE, 0))
+        self.assertEqual(1, model.storage["counter"])
@@ -0,0 +1,31 @@
+from json import load
+from os.path import exists
+from unittest import TestCase
+
+from profile_oracle import BASELINE, THRESHOLD, compare, profile
+
+
+class OracleCostTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.costs = profile()
+
+    def test_costs_stay_within_the_baseline(self):
+        # off until test/oracle_costs.json is recorded from the contract ligo compiles and committed
+        if not exists(BASELINE):
+            self.skipTest(f"COST GATE OFF: no baseline at {BASELINE}, run make baseline and commit it")
+        with open(BASELINE) as f:
+            self.assertEqual([], compare(self.costs, load(f), THRESHOLD))
+
+    def test_operation_size_does_not_depend_on_the_storage(self):
+        for name, curve in self.costs.items():
+            self.assertEqual(1, len({costs["operation_bytes"] for costs in curve.values()}), name)
+
+    def test_compare_reports_the_costs_above_the_threshold(self):
+        baseline = {"update": {"1000": {"instructions": 100, "storage_bytes": 1000, "paid_storage": 0,
+                                        "operation_bytes": 200}}}
+        costs = {"update": {"1000": {"instructions": 104, "storage_bytes": 1200, "paid_storage": 0,
+                                     "operation_bytes": 200, "seconds": 1}},
+                 "set_admin": {"1": {"instructions": 10, "storage_bytes": 10, "paid_storage": 0,
+                                     "operation_bytes": 10, "seconds": 1}}}
+        self.assertEqual(["update with 1000 pairs: storage_bytes 1000 -> 1200"], compare(costs, baseline, 0.05))